@@ -1,5 +1,5 @@
-from pygame.time import Clock
 import json
+import struct
 
 from graphics import Tia
 # from cpu import Core
@@ -10,7 +10,7 @@ import controllers
 
 class Settings:
     def __init__(self):
-        from os.path import dirname, isfile, exists
+        from os.path import dirname, isfile
 
         self.path = dirname(__file__) + "/"
         if not isfile(self.path + "settings.json"):
@@ -32,6 +32,11 @@ class Settings:
                 }
                 json.dump(data, f, indent=4)
         self.file = json.load(open(self.path + "settings.json"))
+
+    def select_rom(self):
+        # asks which rom to run, returns (filepath, bank-switching, super-chip)
+        from os.path import exists
+
         roms = self.file["roms"]
 
         self.rom_super_chip = ""
@@ -68,6 +73,9 @@ class Settings:
                     else:
                         print("Invalid number or path")
 
+        return self.rom_filepath, self.rom_bank_switching, self.rom_super_chip == "yes"
+
+    def load_key_binds(self):
         keys = self.file["key-binds"]
         import pygame.locals as pygame_locals
         self.up_key = pygame_locals.__dict__[keys["joystick up"]]
@@ -104,6 +112,8 @@ class Settings:
 
 
 class Timer:
+    state_format = struct.Struct("<qqqhhHB?")
+
     def __init__(self):
         # time is cycles of TIA
         # 3 TIA cycles = 1 CPU cycle
@@ -156,20 +166,116 @@ class Timer:
         self.riot_interval_timer = interval - 1
         self.riot_status &= 0x40
 
+    def save_state(self):
+        return self.state_format.pack(
+            self.time, self.tia_last_update, self.riot_last_update, self.riot_timer, self.riot_interval_timer,
+            self.riot_interval, self.riot_status, self.frame_done
+        )
+
+    def load_state(self, data):
+        (self.time, self.tia_last_update, self.riot_last_update, self.riot_timer, self.riot_interval_timer,
+         self.riot_interval, self.riot_status, self.frame_done) = self.state_format.unpack(data)
+
 
 class Atari2600:
-    def __init__(self):
-        self.settings = Settings()
+    # save states start with this, load_state refuses other versions
+    state_header = struct.Struct("<4sB")
+    state_magic = b"A26S"
+    state_version = 1
+
+    def __init__(self, rom, bank_switching="", super_chip=False, controller="joystick", audio=True, display=True,
+                 recompile=False, lazy_compose=False):
+        # settings.json is only read for the key binds of the display window,
+        # without a display nothing here imports pygame
+        self.settings = None
+        if display:
+            self.settings = Settings()
+            self.settings.load_key_binds()
         self.timer = Timer()
-        self.controller = controllers.Joystick(self.settings)
-        # self.controller = controllers.Paddles(self.settings)
-        # self.controller = controllers.Keypad(self.settings)
+        self.controller = controllers.controller_types[controller](self.settings)
+
+        self.tia = Tia(self.timer, self.controller, audio=audio, display=display, lazy_compose=lazy_compose)
+        self.memory = Memory(self.timer, self.controller, self.tia, rom, bank_switching, super_chip)
+        self.cpu = Core(self.timer, self.memory, recompile=recompile)
 
-        self.tia = Tia(self.timer, self.controller)
-        self.memory = Memory(self.timer, self.controller, self.tia, self.settings)
-        self.cpu = Core(self.timer, self.memory)
+        # noop frames: (save state, last frame), filled in by reset
+        self.start_states = {0: (self.save_state(), self.tia.frame.copy())}
+
+    def run_frames(self, frames):
+        # runs as fast as possible, nothing here waits on the display
+        step = self.cpu.step
+        timer = self.timer
+        for _ in range(frames):
+            step()
+            timer.frame_done = False
+
+    def reset(self, noops=0):
+        # puts the machine back as it was at power on, or noops frames after that with nothing
+        # pressed, in place (the rom, tables and translated code are kept), each start state is
+        # only emulated the first time it's asked for
+        start = self.start_states.get(noops)
+        if start is None:
+            # only the last noop frame is drawn, and always drawn, so the cached picture
+            # doesn't depend on whether the caller has rendering on
+            rendering = self.tia.rendering
+            self.reset()
+            self.tia.set_rendering(False)
+            self.run_frames(noops - 1)
+            self.tia.set_rendering(True)
+            self.run_frames(1)
+            self.tia.set_rendering(rendering)
+            self.start_states[noops] = (self.save_state(), self.tia.frame.copy())
+            return
+        state, frame = start
+        self.load_state(state)
+        self.tia.frame[:] = frame
+
+    def clone(self, frame_buffer=False):
+        # another emulator in the same state, sharing the rom, instruction tables and translated
+        # blocks, without a window or audio, frame_buffer also copies the last picture
+        from copy import copy
+
+        other = copy(self)
+        other.timer = copy(self.timer)
+        other.controller = copy(self.controller)
+        other.tia = self.tia.clone(other.timer, other.controller, frame_buffer)
+        other.memory = self.memory.clone(other.timer, other.controller, other.tia)
+        other.cpu = self.cpu.clone(other.timer, other.memory)
+        return other
+
+    def save_state(self, frame_buffer=False):
+        # the whole machine as bytes, the two frame buffers are left out unless asked for
+        # (between frames the one being drawn is blank anyway)
+        parts = (
+            self.cpu.save_state(),
+            self.timer.save_state(),
+            self.memory.save_state(),
+            self.tia.save_state(frame_buffer),
+            self.controller.save_state()
+        )
+        out = [self.state_header.pack(self.state_magic, self.state_version)]
+        for part in parts:
+            out.append(struct.pack("<I", len(part)))
+            out.append(part)
+        return b"".join(out)
+
+    def load_state(self, data):
+        magic, version = self.state_header.unpack_from(data)
+        if magic != self.state_magic:
+            raise ValueError("not an Atari2600 save state")
+        if version != self.state_version:
+            raise ValueError(f"save state version {version} isn't supported (expected {self.state_version})")
+
+        offset = self.state_header.size
+        for component in (self.cpu, self.timer, self.memory, self.tia, self.controller):
+            size, = struct.unpack_from("<I", data, offset)
+            offset += 4
+            component.load_state(data[offset:offset + size])
+            offset += size
 
     def run_loop(self, cpu_func):
+        from pygame.time import Clock
+
         self.tia.init()
         frames = 0
         clock = Clock()
@@ -181,12 +287,44 @@ class Atari2600:
                 print(clock.get_fps())
                 frames = 0
 
+    def run_ahead(self, frames):
+        # a step function for run_loop that shows the picture from frames ahead of the real
+        # machine, played with the latest input, and then goes back, so input shows up that
+        # many frames sooner, only the frame shown is rendered
+        if frames < 1:
+            raise ValueError(f"run-ahead needs at least 1 frame, got {frames}")
+        step = self.cpu.step
+        timer = self.timer
+        tia = self.tia
+        controller = self.controller
+
+        def run_ahead_step():
+            screen, play_audio = tia.screen, tia.play_audio
+            tia.screen = None
+            tia.set_rendering(False)
+            step()
+            timer.frame_done = False
+            state = self.save_state()
+
+            tia.play_audio = False
+            for frame in range(frames):
+                if frame == frames - 1:
+                    tia.screen = screen
+                    tia.set_rendering(True)
+                step()
+                timer.frame_done = False
+            tia.screen, tia.play_audio = screen, play_audio
+
+            # the input read while showing the frame belongs to the next real one
+            inputs = controller.save_state()
+            self.load_state(state)
+            controller.load_state(inputs)
+
+        return run_ahead_step
+
     def power_on(self):
         self.run_loop(self.cpu.step)
 
-    def debug_power_on(self):
-        self.run_loop(self.cpu.debug_step)
-
     def profile(self):
         from time import time
 
@@ -197,9 +335,85 @@ class Atari2600:
         print(time() - t)
 
 
-if __name__ == "__main__":
-    atari = Atari2600()
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Atari 2600 emulator")
+    parser.add_argument("rom", nargs="?", help="rom file, picked from settings.json when left out")
+    parser.add_argument("-b", "--bank-switching", default="", choices=["2k", "4k", "f8", "e0", "fa", "f6", "f4", "ef"],
+                        help="bank-switching method, guessed from the rom size when left out")
+    parser.add_argument("-s", "--super-chip", action="store_true", help="cartridge has super-chip ram")
+    parser.add_argument("-c", "--controller", default="joystick", choices=list(controllers.controller_types))
+    parser.add_argument("--no-audio", action="store_true")
+    parser.add_argument("--headless", action="store_true", help="no display or audio, needs --frames or --play")
+    parser.add_argument("--frames", type=int, help="run this many frames as fast as possible, then exit")
+    parser.add_argument("--recompile", action="store_true", help="translate rom code into python functions as it runs")
+    parser.add_argument("--lazy-compose", action="store_true",
+                        help="recompose a line only before it is drawn instead of after every tia write")
+    parser.add_argument("--run-ahead", type=int, metavar="FRAMES",
+                        help="show the picture from this many frames ahead to hide input lag")
+    parser.add_argument("--record", metavar="FILE", help="record the inputs of this session into a movie file")
+    parser.add_argument("--play", metavar="FILE", help="replay a movie file as fast as possible, then exit")
+    args = parser.parse_args()
+
+    if args.headless and args.frames is None and args.play is None:
+        parser.error("--headless needs --frames or --play")
+    if args.run_ahead is not None and args.run_ahead < 1:
+        parser.error("--run-ahead needs at least 1 frame")
+    if args.record is not None and (args.frames is not None or args.play is not None):
+        parser.error("--record can't be used with --frames or --play")
 
-    atari.power_on()
-    # atari.debug_power_on()
+    rom, bank_switching, super_chip = args.rom, args.bank_switching, args.super_chip
+    if rom is None:
+        rom, bank_switching, super_chip = Settings().select_rom()
+        bank_switching = args.bank_switching or bank_switching
+        super_chip = args.super_chip or super_chip
+
+    atari = Atari2600(
+        rom,
+        bank_switching=bank_switching,
+        super_chip=super_chip,
+        controller=args.controller,
+        audio=not (args.no_audio or args.headless),
+        display=not args.headless,
+        recompile=args.recompile,
+        lazy_compose=args.lazy_compose
+    )
+
+    if args.play is not None:
+        from time import time
+        from movie import Movie
+
+        movie = Movie.load(args.play)
+        movie.seek(atari, 0)
+        t = time()
+        movie.play(atari)
+        print(f"{movie.frames} frames in {time() - t:.2f}s")
+    elif args.frames is not None:
+        from time import time
+
+        t = time()
+        atari.run_frames(args.frames)
+        print(f"{args.frames} frames in {time() - t:.2f}s")
+    else:
+        if args.run_ahead is not None:
+            step = atari.run_ahead(args.run_ahead)
+        else:
+            step = atari.cpu.step
+
+        if args.record is not None:
+            from movie import Movie
+
+            movie = Movie()
+            try:
+                atari.run_loop(movie.record(atari, step))
+            finally:
+                movie.save(args.record)
+                print(f"recorded {movie.frames} frames to {args.record}")
+        else:
+            atari.run_loop(step)
     # atari.profile()
+
+
+if __name__ == "__main__":
+    main()
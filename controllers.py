@@ -1,6 +1,3 @@
-from pygame.locals import *
-
-
 class Controller:
     def __init__(self, settings):
         self.settings = settings
@@ -19,111 +16,142 @@ class Controller:
         self.input5 = 0x80
 
     def process_events(self, events):
-        self.process_console_switches(events)
+        # one pass over the pygame events, the keys are turned into calls to the set_ methods below
+        from pygame.locals import QUIT, KEYDOWN, KEYUP
 
-    def process_console_switches(self, events):
         for event in events:
             if event.type == QUIT:
                 exit()
-            if event.type == KEYDOWN:
-                # button switches
-                if event.key == self.settings.reset_key:
-                    self.input_b &= ~0x1
-                elif event.key == self.settings.select_key:
-                    self.input_b &= ~0x2
-                # toggle switches
-                elif event.key == self.settings.color_key:
-                    self.input_b ^= 0x8
-                    if self.input_b & 0x8:
-                        print("Color Mode")
-                    else:
-                        print("Black and White Mode")
-                elif event.key == self.settings.diff1_key:  # P0 difficulty switch
-                    self.input_b ^= 0x40
-                    if self.input_b & 0x40:
-                        print("Left Difficulty Switch: (A)dvanced")
-                    else:
-                        print("Left Difficulty Switch: (B)eginner")
-                elif event.key == self.settings.diff2_key:  # P1 difficulty switch
-                    self.input_b ^= 0x80
-                    if self.input_b & 0x80:
-                        print("Right Difficulty Switch: (A)dvanced")
-                    else:
-                        print("Right Difficulty Switch: (B)eginner")
-
-            elif event.type == KEYUP:
-                # switches
-                if event.key == self.settings.reset_key:
-                    self.input_b |= 0x1
-                elif event.key == self.settings.select_key:
-                    self.input_b |= 0x2
+            if event.type == KEYDOWN or event.type == KEYUP:
+                self.process_console_switch(event.key, event.type == KEYDOWN)
+                self.process_key(event.key, event.type == KEYDOWN)
+
+    def process_key(self, key, pressed):
+        pass
+
+    def save_state(self):
+        return bytes((self.input_a, self.input_b, self.input0, self.input1, self.input2, self.input3, self.input4,
+                      self.input5))
+
+    def load_state(self, data):
+        (self.input_a, self.input_b, self.input0, self.input1, self.input2, self.input3, self.input4,
+         self.input5) = data
+
+    def set_switches(self, reset=None, select=None, color=None, left_difficulty=None, right_difficulty=None):
+        # None leaves a switch as it is, reset and select are held while True,
+        # difficulty True is (A)dvanced
+        if reset is not None:
+            self.input_b = self.input_b & ~0x1 if reset else self.input_b | 0x1
+        if select is not None:
+            self.input_b = self.input_b & ~0x2 if select else self.input_b | 0x2
+        if color is not None:
+            self.input_b = self.input_b | 0x8 if color else self.input_b & ~0x8
+        if left_difficulty is not None:
+            self.input_b = self.input_b | 0x40 if left_difficulty else self.input_b & ~0x40
+        if right_difficulty is not None:
+            self.input_b = self.input_b | 0x80 if right_difficulty else self.input_b & ~0x80
+
+    def process_console_switch(self, key, pressed):
+        # button switches
+        if key == self.settings.reset_key:
+            self.set_switches(reset=pressed)
+        elif key == self.settings.select_key:
+            self.set_switches(select=pressed)
+        elif not pressed:
+            return
+        # toggle switches
+        elif key == self.settings.color_key:
+            self.set_switches(color=not self.input_b & 0x8)
+            if self.input_b & 0x8:
+                print("Color Mode")
+            else:
+                print("Black and White Mode")
+        elif key == self.settings.diff1_key:  # P0 difficulty switch
+            self.set_switches(left_difficulty=not self.input_b & 0x40)
+            if self.input_b & 0x40:
+                print("Left Difficulty Switch: (A)dvanced")
+            else:
+                print("Left Difficulty Switch: (B)eginner")
+        elif key == self.settings.diff2_key:  # P1 difficulty switch
+            self.set_switches(right_difficulty=not self.input_b & 0x80)
+            if self.input_b & 0x80:
+                print("Right Difficulty Switch: (A)dvanced")
+            else:
+                print("Right Difficulty Switch: (B)eginner")
 
 
 class Joystick(Controller):
     def __init__(self, settings):
         super().__init__(settings)
 
-    def process_events(self, events):
-        self.process_console_switches(events)
-        for event in events:
-            if event.type == KEYDOWN:
-                if event.key == self.settings.up_key:
-                    self.input_a &= ~0x10
-                elif event.key == self.settings.down_key:
-                    self.input_a &= ~0x20
-                elif event.key == self.settings.left_key:
-                    self.input_a &= ~0x40
-                elif event.key == self.settings.right_key:
-                    self.input_a &= ~0x80
-                elif event.key == self.settings.fire_key:
-                    self.input4 &= ~0x80
-
-            elif event.type == KEYUP:
-                if event.key == self.settings.up_key:
-                    self.input_a |= 0x10
-                elif event.key == self.settings.down_key:
-                    self.input_a |= 0x20
-                elif event.key == self.settings.left_key:
-                    self.input_a |= 0x40
-                elif event.key == self.settings.right_key:
-                    self.input_a |= 0x80
-                elif event.key == self.settings.fire_key:
-                    self.input4 |= 0x80
+        # directions held on the keyboard, for the left joystick
+        self.held = {"up": False, "down": False, "left": False, "right": False, "fire": False}
+
+    def set_joystick(self, port, up=False, down=False, left=False, right=False, fire=False):
+        # port 0 is the left joystick, 1 the right one
+        released = ~(up | down << 1 | left << 2 | right << 3)
+        if port == 0:
+            self.input_a = (self.input_a & 0x0F) | (released << 4 & 0xF0)
+            self.input4 = 0x00 if fire else 0x80
+        else:
+            self.input_a = (self.input_a & 0xF0) | (released & 0x0F)
+            self.input5 = 0x00 if fire else 0x80
+
+    def process_key(self, key, pressed):
+        settings = self.settings
+        if key == settings.up_key:
+            self.held["up"] = pressed
+        elif key == settings.down_key:
+            self.held["down"] = pressed
+        elif key == settings.left_key:
+            self.held["left"] = pressed
+        elif key == settings.right_key:
+            self.held["right"] = pressed
+        elif key == settings.fire_key:
+            self.held["fire"] = pressed
+        else:
+            return
+        self.set_joystick(0, **self.held)
 
 
 class Paddles(Controller):
+    # fire buttons of paddles 0 to 3 in input_a
+    fire_bits = (0x80, 0x40, 0x08, 0x04)
+
     def __init__(self, settings):
         super().__init__(settings)
 
-    def process_events(self, events):
-        self.process_console_switches(events)
-        for event in events:
-            if event.type == KEYDOWN:
-                if event.key == self.settings.left_key:
-                    self.input0 = (self.input0 - 5) & 0xFF
-                    print(self.input0)
-                elif event.key == self.settings.right_key:
-                    self.input0 = (self.input0 + 5) & 0xFF
-                    print(self.input0)
-                elif event.key == self.settings.up_key:
-                    self.input0 = 0
-                    print(self.input0)
-                elif event.key == self.settings.fire_key:
-                    self.input_a &= ~0x80
-
-            elif event.type == KEYUP:
-                if event.key == self.settings.fire_key:
-                    self.input_a |= 0x80
+    def set_paddle(self, port, value=None, fire=None):
+        # port is the paddle (0 to 3), value its position, None leaves either as it is
+        if value is not None:
+            setattr(self, f"input{port}", value & 0xFF)
+        if fire is not None:
+            bit = self.fire_bits[port]
+            self.input_a = self.input_a & ~bit if fire else self.input_a | bit
+
+    def process_key(self, key, pressed):
+        if key == self.settings.fire_key:
+            self.set_paddle(0, fire=pressed)
+        elif not pressed:
+            return
+        elif key == self.settings.left_key:
+            self.set_paddle(0, self.input0 - 5)
+            print(self.input0)
+        elif key == self.settings.right_key:
+            self.set_paddle(0, self.input0 + 5)
+            print(self.input0)
+        elif key == self.settings.up_key:
+            self.set_paddle(0, 0)
+            print(self.input0)
 
 
 class Keypad(Controller):
     def __init__(self, settings):
         super().__init__(settings)
 
-    def process_events(self, events):
-        self.process_console_switches(events)
-        for event in events:
-            if event.type == KEYDOWN:
-                pass
-            elif event.type == KEYUP:
-                pass
+
+controller_types = {
+    "joystick": Joystick,
+    "paddles": Paddles,
+    "keypad": Keypad
+}
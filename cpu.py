@@ -1,3 +1,6 @@
+from opcodes import instructions
+
+
 class Core:
     def __init__(self, timer, memory):
         self.timer = timer
@@ -64,11 +67,8 @@ class Core:
         self.n = value >> 7
 
     def status_to_int(self):
-        out = 0
-        status_array = (self.c, self.z, self.i, self.d, self.b, 1, self.v, self.n)
-        for i in range(8):
-            out += (status_array[i] & 0x1) << i
-        return out
+        return ((self.c & 0x1) | (self.z & 0x1) << 1 | (self.i & 0x1) << 2 | (self.d & 0x1) << 3 |
+                (self.b & 0x1) << 4 | 0x20 | (self.v & 0x1) << 6 | (self.n & 0x1) << 7)
 
     def set_status(self, value):
         self.c = value & 0x1
@@ -174,7 +174,7 @@ class Core:
             if lo > 0x09:
                 hi += 0x10
                 lo += 0x06
-            self.n = hi & 0x80
+            self.n = (hi >> 7) & 0x1
             self.v = ~(self.a ^ value) & (self.a ^ hi) & 0x80 != 0
             if hi > 0x90:
                 hi += 0x60
@@ -496,190 +496,38 @@ class Core:
     """
 
     def get_opcodes(self):
-        return {
-            0x69: AddressedInstruction(self.adc, 2, self.immediate),
-            0x65: AddressedInstruction(self.adc, 3, self.zero_page),
-            0x75: AddressedInstruction(self.adc, 4, self.zero_page_x),
-            0x6D: AddressedInstruction(self.adc, 4, self.absolute),
-            0x7D: AddressedInstruction(self.adc, 4, self.delayed_absolute_x),
-            0x79: AddressedInstruction(self.adc, 4, self.delayed_absolute_y),
-            0x61: AddressedInstruction(self.adc, 6, self.indirect_x),
-            0x71: AddressedInstruction(self.adc, 5, self.delayed_indirect_y),
-
-            0x29: AddressedInstruction(self.and_, 2, self.immediate),
-            0x25: AddressedInstruction(self.and_, 3, self.zero_page),
-            0x35: AddressedInstruction(self.and_, 4, self.zero_page_x),
-            0x2D: AddressedInstruction(self.and_, 4, self.absolute),
-            0x3D: AddressedInstruction(self.and_, 4, self.delayed_absolute_x),
-            0x39: AddressedInstruction(self.and_, 4, self.delayed_absolute_y),
-            0x21: AddressedInstruction(self.and_, 6, self.indirect_x),
-            0x31: AddressedInstruction(self.and_, 5, self.delayed_indirect_y),
-
-            0x0A: Instruction(self.asl_acc, 2),  # uses accumulator instead of address
-            0x06: AddressedInstruction(self.asl, 5, self.zero_page),
-            0x16: AddressedInstruction(self.asl, 6, self.zero_page_x),
-            0x0E: AddressedInstruction(self.asl, 6, self.absolute),
-            0x1E: AddressedInstruction(self.asl, 7, self.absolute_x),
-
-            0x24: AddressedInstruction(self.bit, 3, self.zero_page),
-            0x2C: AddressedInstruction(self.bit, 4, self.absolute),
-
-            0x10: AddressedInstruction(self.bpl, 2, self.immediate),
-            0x30: AddressedInstruction(self.bmi, 2, self.immediate),
-            0x50: AddressedInstruction(self.bvc, 2, self.immediate),
-            0x70: AddressedInstruction(self.bvs, 2, self.immediate),
-            0x90: AddressedInstruction(self.bcc, 2, self.immediate),
-            0xB0: AddressedInstruction(self.bcs, 2, self.immediate),
-            0xD0: AddressedInstruction(self.bne, 2, self.immediate),
-            0xF0: AddressedInstruction(self.beq, 2, self.immediate),
-
-            0x00: Instruction(self.brk, 7),
-
-            0xC9: AddressedInstruction(self.cmp, 2, self.immediate),
-            0xC5: AddressedInstruction(self.cmp, 3, self.zero_page),
-            0xD5: AddressedInstruction(self.cmp, 4, self.zero_page_x),
-            0xCD: AddressedInstruction(self.cmp, 4, self.absolute),
-            0xDD: AddressedInstruction(self.cmp, 4, self.delayed_absolute_x),
-            0xD9: AddressedInstruction(self.cmp, 4, self.delayed_absolute_y),
-            0xC1: AddressedInstruction(self.cmp, 6, self.indirect_x),
-            0xD1: AddressedInstruction(self.cmp, 5, self.delayed_indirect_y),
-
-            0xE0: AddressedInstruction(self.cpx, 2, self.immediate),
-            0xE4: AddressedInstruction(self.cpx, 3, self.zero_page),
-            0xEC: AddressedInstruction(self.cpx, 4, self.absolute),
-
-            0xC0: AddressedInstruction(self.cpy, 2, self.immediate),
-            0xC4: AddressedInstruction(self.cpy, 3, self.zero_page),
-            0xCC: AddressedInstruction(self.cpy, 4, self.absolute),
-
-            0xC6: AddressedInstruction(self.dec, 5, self.zero_page),
-            0xD6: AddressedInstruction(self.dec, 6, self.zero_page_x),
-            0xCE: AddressedInstruction(self.dec, 6, self.absolute),
-            0xDE: AddressedInstruction(self.dec, 7, self.absolute_x),
-
-            0x49: AddressedInstruction(self.eor, 2, self.immediate),
-            0x45: AddressedInstruction(self.eor, 3, self.zero_page),
-            0x55: AddressedInstruction(self.eor, 4, self.zero_page_x),
-            0x4D: AddressedInstruction(self.eor, 4, self.absolute),
-            0x5D: AddressedInstruction(self.eor, 4, self.delayed_absolute_x),
-            0x59: AddressedInstruction(self.eor, 4, self.delayed_absolute_y),
-            0x41: AddressedInstruction(self.eor, 6, self.indirect_x),
-            0x51: AddressedInstruction(self.eor, 5, self.delayed_indirect_y),
-
-            0x18: Instruction(self.clc, 2),
-            0xD8: Instruction(self.cld, 2),
-            0x58: Instruction(self.cli, 2),
-            0xB8: Instruction(self.clv, 2),
-            0x38: Instruction(self.sec, 2),
-            0x78: Instruction(self.sei, 2),
-            0xF8: Instruction(self.sed, 2),
-
-            0xE6: AddressedInstruction(self.inc, 5, self.zero_page),
-            0xF6: AddressedInstruction(self.inc, 6, self.zero_page_x),
-            0xEE: AddressedInstruction(self.inc, 6, self.absolute),
-            0xFE: AddressedInstruction(self.inc, 7, self.absolute_x),
-
-            0x4C: AddressedInstruction(self.jmp, 3, self.absolute),
-            0x6C: AddressedInstruction(self.jmp, 5, self.indirect),
-
-            0x20: AddressedInstruction(self.jsr, 6, self.absolute),
-
-            0xA9: AddressedInstruction(self.lda, 2, self.immediate),
-            0xA5: AddressedInstruction(self.lda, 3, self.zero_page),
-            0xB5: AddressedInstruction(self.lda, 4, self.zero_page_x),
-            0xAD: AddressedInstruction(self.lda, 4, self.absolute),
-            0xBD: AddressedInstruction(self.lda, 4, self.delayed_absolute_x),
-            0xB9: AddressedInstruction(self.lda, 4, self.delayed_absolute_y),
-            0xA1: AddressedInstruction(self.lda, 6, self.indirect_x),
-            0xB1: AddressedInstruction(self.lda, 5, self.delayed_indirect_y),
-
-            0xA2: AddressedInstruction(self.ldx, 2, self.immediate),
-            0xA6: AddressedInstruction(self.ldx, 3, self.zero_page),
-            0xB6: AddressedInstruction(self.ldx, 4, self.zero_page_y),
-            0xAE: AddressedInstruction(self.ldx, 4, self.absolute),
-            0xBE: AddressedInstruction(self.ldx, 4, self.delayed_absolute_y),
-
-            0xA0: AddressedInstruction(self.ldy, 2, self.immediate),
-            0xA4: AddressedInstruction(self.ldy, 3, self.zero_page),
-            0xB4: AddressedInstruction(self.ldy, 4, self.zero_page_x),
-            0xAC: AddressedInstruction(self.ldy, 4, self.absolute),
-            0xBC: AddressedInstruction(self.ldy, 4, self.delayed_absolute_x),
-
-            0x4a: Instruction(self.lsr_acc, 2),  # uses accumulator instead of address
-            0x46: AddressedInstruction(self.lsr, 5, self.zero_page),
-            0x56: AddressedInstruction(self.lsr, 6, self.zero_page_x),
-            0x4E: AddressedInstruction(self.lsr, 6, self.absolute),
-            0x5E: AddressedInstruction(self.lsr, 7, self.absolute_x),
-
-            0xEA: Instruction(self.nop, 2),
-
-            0x09: AddressedInstruction(self.ora, 2, self.immediate),
-            0x05: AddressedInstruction(self.ora, 3, self.zero_page),
-            0x15: AddressedInstruction(self.ora, 4, self.zero_page_x),
-            0x0D: AddressedInstruction(self.ora, 4, self.absolute),
-            0x1D: AddressedInstruction(self.ora, 4, self.delayed_absolute_x),
-            0x19: AddressedInstruction(self.ora, 4, self.delayed_absolute_y),
-            0x01: AddressedInstruction(self.ora, 6, self.indirect_x),
-            0x11: AddressedInstruction(self.ora, 5, self.delayed_indirect_y),
-
-            0xAA: Instruction(self.tax, 2),
-            0x8A: Instruction(self.txa, 2),
-            0xCA: Instruction(self.dex, 2),
-            0xE8: Instruction(self.inx, 2),
-            0xA8: Instruction(self.tay, 2),
-            0x98: Instruction(self.tya, 2),
-            0x88: Instruction(self.dey, 2),
-            0xC8: Instruction(self.iny, 2),
-
-            0x2A: Instruction(self.rol_acc, 2),  # uses accumulator instead of address
-            0x26: AddressedInstruction(self.rol, 5, self.zero_page),
-            0x36: AddressedInstruction(self.rol, 6, self.zero_page_x),
-            0x2E: AddressedInstruction(self.rol, 6, self.absolute),
-            0x3E: AddressedInstruction(self.rol, 7, self.absolute_x),
-
-            0x6A: Instruction(self.ror_acc, 2),  # uses accumulator instead of address
-            0x66: AddressedInstruction(self.ror, 5, self.zero_page),
-            0x76: AddressedInstruction(self.ror, 6, self.zero_page_x),
-            0x6E: AddressedInstruction(self.ror, 6, self.absolute),
-            0x7E: AddressedInstruction(self.ror, 7, self.absolute_x),
-
-            0x40: Instruction(self.rti, 6),
-
-            0x60: Instruction(self.rts, 6),
-
-            0xE9: AddressedInstruction(self.sbc, 2, self.immediate),
-            0xE5: AddressedInstruction(self.sbc, 3, self.zero_page),
-            0xF5: AddressedInstruction(self.sbc, 4, self.zero_page_x),
-            0xED: AddressedInstruction(self.sbc, 4, self.absolute),
-            0xFD: AddressedInstruction(self.sbc, 4, self.delayed_absolute_x),
-            0xF9: AddressedInstruction(self.sbc, 4, self.delayed_absolute_y),
-            0xE1: AddressedInstruction(self.sbc, 6, self.indirect_x),
-            0xF1: AddressedInstruction(self.sbc, 5, self.delayed_indirect_y),
-
-            0x85: AddressedInstruction(self.sta, 3, self.zero_page),
-            0x95: AddressedInstruction(self.sta, 4, self.zero_page_x),
-            0x8D: AddressedInstruction(self.sta, 4, self.absolute),
-            0x9D: AddressedInstruction(self.sta, 5, self.absolute_x),
-            0x99: AddressedInstruction(self.sta, 5, self.absolute_y),
-            0x81: AddressedInstruction(self.sta, 6, self.indirect_x),
-            0x91: AddressedInstruction(self.sta, 6, self.indirect_y),
-
-            0x9A: Instruction(self.txs, 2),
-            0xBA: Instruction(self.tsx, 2),
-            0x48: Instruction(self.pha, 3),
-            0x68: Instruction(self.pla, 4),
-            0x08: Instruction(self.php, 3),
-            0x28: Instruction(self.plp, 4),
-
-            0x86: AddressedInstruction(self.stx, 3, self.zero_page),
-            0x96: AddressedInstruction(self.stx, 4, self.zero_page_y),
-            0x8E: AddressedInstruction(self.stx, 4, self.absolute),
-
-            0x84: AddressedInstruction(self.sty, 3, self.zero_page),
-            0x94: AddressedInstruction(self.sty, 4, self.zero_page_x),
-            0x8C: AddressedInstruction(self.sty, 4, self.absolute),
+        # built from the table in opcodes.py, like the optimized core
+        addressing_modes = {
+            "im": self.immediate,
+            "rel": self.immediate,
+            "zp": self.zero_page,
+            "zpx": self.zero_page_x,
+            "zpy": self.zero_page_y,
+            "ab": self.absolute,
+            "abx": self.absolute_x,
+            "aby": self.absolute_y,
+            "in": self.indirect,
+            "inx": self.indirect_x,
+            "iny": self.indirect_y
+        }
+        page_penalty_modes = {
+            "abx": self.delayed_absolute_x,
+            "aby": self.delayed_absolute_y,
+            "iny": self.delayed_indirect_y
         }
 
+        opcodes = {}
+        for opcode, (operation, mode, cycles, page_penalty) in instructions.items():
+            if mode == "imp":
+                opcodes[opcode] = Instruction(getattr(self, operation), cycles)
+            elif mode == "acc":  # uses accumulator instead of address
+                opcodes[opcode] = Instruction(getattr(self, operation + "_acc"), cycles)
+            else:
+                function = self.and_ if operation == "and" else getattr(self, operation)
+                addressing_mode = page_penalty_modes[mode] if page_penalty else addressing_modes[mode]
+                opcodes[opcode] = AddressedInstruction(function, cycles, addressing_mode)
+        return opcodes
+
 
 class Instruction:
     def __init__(self, function, cycles):
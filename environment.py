@@ -0,0 +1,125 @@
+# a reset()/step(action) wrapper for agents, actions press the left joystick directly
+# and reward/terminal are read from ram
+import random
+
+import numpy as np
+
+from atari import Atari2600
+
+# the 18 standard joystick actions, in the usual order
+action_names = (
+    "NOOP", "FIRE", "UP", "RIGHT", "LEFT", "DOWN", "UPRIGHT", "UPLEFT", "DOWNRIGHT", "DOWNLEFT",
+    "UPFIRE", "RIGHTFIRE", "LEFTFIRE", "DOWNFIRE", "UPRIGHTFIRE", "UPLEFTFIRE", "DOWNRIGHTFIRE", "DOWNLEFTFIRE"
+)
+direction_bits = {"UP": 0x10, "DOWN": 0x20, "LEFT": 0x40, "RIGHT": 0x80}
+
+
+def action_to_inputs(name):
+    # (left joystick nibble of input_a, input4), both active low
+    pressed = 0
+    for direction, bit in direction_bits.items():
+        if direction in name:
+            pressed |= bit
+    return 0xF0 & ~pressed, 0x00 if "FIRE" in name else 0x80
+
+
+action_inputs = tuple(action_to_inputs(name) for name in action_names)
+
+
+class Environment:
+    actions = len(action_names)
+
+    def __init__(self, rom, spec=None, frame_skip=1, observation="frame", display=False, noop_max=0, seed=None,
+                 **options):
+        # spec describes the rom's ram, all of it optional:
+        #   "score": ram addresses of the score, most significant first
+        #   "bcd": whether the score is stored as decimal digits (default true)
+        #   "terminal": [address, mask, value], the episode is over once ram[address] & mask == value
+        # options are passed on to Atari2600, observation is "frame" or "ram", reset starts
+        # a random 0 to noop_max frames after power on
+        self.spec = spec or {}
+        self.frame_skip = frame_skip
+        self.observation = observation
+        self.atari = Atari2600(rom, audio=False, display=display, **options)
+        self.screen = None
+        if display:
+            self.atari.tia.init()
+            self.screen = self.atari.tia.screen
+
+        self.score_addresses = [address & 0x7F for address in self.spec.get("score", ())]
+        self.bcd = self.spec.get("bcd", True)
+        self.terminal = self.spec.get("terminal")
+        if self.terminal is not None:
+            address, mask, value = self.terminal
+            self.terminal = address & 0x7F, mask, value
+
+        self.noop_max = noop_max
+        self.random = random.Random(seed)
+        self.score = 0
+
+    def reset(self):
+        self.atari.reset(self.random.randint(0, self.noop_max) if self.noop_max else 0)
+        self.score = self.get_score()
+        return self.get_observation()
+
+    def step(self, action):
+        # repeats action for frame_skip frames (fewer if the episode ends), only the last one
+        # is rendered and shown (a frame that ends the episode early is run again from a state
+        # saved before it, this time rendered), returns (observation, reward, terminal, info)
+        controller = self.atari.controller
+        tia = self.atari.tia
+        input_a, controller.input4 = action_inputs[action]
+        controller.input_a = (controller.input_a & 0x0F) | input_a
+
+        render = self.observation == "frame" or self.screen is not None
+        terminal = False
+        frames = 0
+        tia.screen = None
+        tia.set_rendering(False)
+        while frames < self.frame_skip and not terminal:
+            frames += 1
+            state = None
+            if frames == self.frame_skip:
+                tia.screen = self.screen
+                tia.set_rendering(render)
+            elif render:
+                state = self.atari.save_state()
+            self.atari.run_frames(1)
+            terminal = self.is_terminal()
+            if terminal and state is not None:
+                self.atari.load_state(state)
+                tia.screen = self.screen
+                tia.set_rendering(True)
+                self.atari.run_frames(1)
+        tia.screen = self.screen
+        tia.set_rendering(True)
+
+        score = self.get_score()
+        reward = score - self.score
+        self.score = score
+        return self.get_observation(), reward, terminal, {"frames": frames}
+
+    def get_score(self):
+        ram = self.atari.memory.ram
+        score = 0
+        for address in self.score_addresses:
+            value = ram[address]
+            if self.bcd:
+                score = score * 100 + (value >> 4) * 10 + (value & 0xF)
+            else:
+                score = (score << 8) | value
+        return score
+
+    def is_terminal(self):
+        if self.terminal is None:
+            return False
+        address, mask, value = self.terminal
+        return self.atari.memory.ram[address] & mask == value
+
+    def get_observation(self):
+        if self.observation == "ram":
+            return np.array(self.atari.memory.ram, "uint8")
+        # height x width (220 x 160) colours, the horizontal blank is left out, and the frame
+        # buffers are swapped every frame, so hand out a copy
+        tia = self.atari.tia
+        return tia.frame.reshape(tia.height, tia.line_width)[:, tia.line_width - tia.width:].copy()
@@ -1,8 +1,9 @@
+import struct
+from functools import lru_cache
+
 import numpy as np
-import pygame
 
 from colors import color_table
-from audio import Audio
 
 # bit of a hack to avoid method lookups
 np.where = np.core.umath.where
@@ -22,19 +23,41 @@ class Tia:
     # screen buffer sizes
     canvas_pixels = line_width * height  # size of emulated screen
 
-    # aspect ratio (5:3)
-    width_ratio = 5
-    height_ratio = 3
-
-    # final picture dimensions
-    picture_dims = (width * width_ratio, height * height_ratio)
-    scaling_dims = (line_width * width_ratio, height * height_ratio)
-    cropping_dims = (68 * width_ratio, 0, width * width_ratio, height * height_ratio)
-
-    def __init__(self, timer, controller):
-        self.play_audio = True
-        # self.play_audio = False
-        self.audio = Audio()
+    # the plain registers and latches kept in a save state, with their struct formats,
+    # the arrays are saved separately
+    state_attributes = (
+        ("v_sync", "B"), ("v_blank", "B"),
+        ("color_p0", "I"), ("color_p1", "I"), ("color_pf", "I"), ("color_bk", "I"),
+        ("pf_reflected", "B"), ("pf_score", "B"), ("pf_priority", "B"), ("p0_reflected", "B"), ("p1_reflected", "B"),
+        ("p0_graphics", "B"), ("p1_graphics", "B"), ("m0_graphics", "B"), ("m1_graphics", "B"), ("bl_graphics", "B"),
+        ("p0_draw_time", "i"), ("p1_draw_time", "i"), ("m0_draw_time", "i"), ("m1_draw_time", "i"),
+        ("bl_draw_time", "i"),
+        ("p0_hm", "b"), ("p1_hm", "b"), ("m0_hm", "b"), ("m1_hm", "b"), ("bl_hm", "b"),
+        ("p0_size", "B"), ("p1_size", "B"),
+        ("m0_enabled", "B"), ("m1_enabled", "B"), ("res_m_p0", "B"), ("res_m_p1", "B"), ("bl_enabled", "B"),
+        ("collision0", "B"), ("collision1", "B"), ("collision2", "B"), ("collision3", "B"),
+        ("collision4", "B"), ("collision5", "B"), ("collision6", "B"), ("collision7", "B"),
+        ("collision_m0", "B"), ("collision_m1", "B"), ("collision_bl", "B"),
+        ("current_pixel", "I"),
+    )
+    state_format = struct.Struct("<" + "".join(fmt for _, fmt in state_attributes))
+    state_names = tuple(name for name, _ in state_attributes)
+
+    # decoded players, shared by every tia and never changed in place: (graphics, reflected,
+    # size) drawn at 0 twice over so any position is a slice of it, and whole lines for players
+    # left of 0, where each copy is pushed back on screen by itself
+    player_masks = {}
+    edge_player_masks = {}
+
+    def __init__(self, timer, controller, audio=True, display=True, lazy_compose=False):
+        # audio and display are the only parts that need pygame,
+        # with both turned off the tia runs headless
+        self.play_audio = audio
+        self.audio = None
+        if audio:
+            from audio import Audio
+            self.audio = Audio()
+        self.display = display
         # control, frequency, volume
         self.sound0 = [0, 0, 0]
         self.sound1 = [0, 0, 0]
@@ -42,7 +65,6 @@ class Tia:
         self.timer = timer
         self.controller = controller
         self.screen = None
-        self.background = None
 
         self.v_sync = False
         self.v_blank = False
@@ -63,11 +85,11 @@ class Tia:
         self.p1_reflected = False
 
         self.canvas = np.zeros(self.canvas_pixels, dtype="int32")
+        self.frame = np.zeros(self.canvas_pixels, dtype="int32")  # last finished frame
 
         self.cur_line2 = np.zeros(self.line_width, dtype="int32")
         self.cur_line = np.split(self.cur_line2, [68])[1]
 
-        self.combined_pf = np.zeros(40, dtype="int8")
         self.pf_tmp = np.zeros(3, dtype="uint8")
 
         self.p0_graphics = 0
@@ -115,9 +137,45 @@ class Tia:
         self.collision_m1 = 0
         self.collision_bl = 0
 
+        # what was drawn since the collision registers were last worked out, see record_collisions
+        self.collision_spans = []
+        self.collision_key = None
+
         self.current_pixel = 0
+        self.line_dirty = False  # cur_line is behind the registers, see mark_line
+
+        # with lazy_compose a write only marks the line as changed, and the whole line is
+        # composed before its visible pixels are next copied to the canvas, so writes that
+        # land in the horizontal blank share one composition, the picture is the same
+        self.lazy_compose = lazy_compose
+        self.rendering = True
+
+        self.write_table = self.get_write_table()
+        self.set_renderer()
+
+    def set_rendering(self, rendering):
+        # with rendering off the tia keeps up everything the cpu can see (collisions, inputs,
+        # timing, vsync and vblank) but never touches the canvas, the line or the screen, and
+        # self.frame keeps the last picture drawn, only change it between frames
+        self.rendering = rendering
+        self.set_renderer()
+
+    def set_renderer(self):
+        # picks the draw_line and update that go with the renderer and rendering settings
+        if not self.rendering:
+            self.draw_line = self.mark_line
+            self.update = self.skip_update
+        elif self.lazy_compose:
+            self.draw_line = self.mark_line
+            self.update = self.update_lazy
+        else:
+            self.__dict__.pop("draw_line", None)
+            self.__dict__.pop("update", None)
+            if self.line_dirty:
+                self.compose_line()
 
-        self.write_table = {
+    def get_write_table(self):
+        return {
             0: self.write_v_sync,
             1: self.write_v_blank,
             2: self.write_w_sync,
@@ -165,13 +223,77 @@ class Tia:
             44: self.write_collisions_clear
         }
 
+    def clone(self, timer, controller, frame_buffer=False):
+        # a copy for another emulator, without the screen or audio, the picture being
+        # drawn starts blank and the last one is only copied when asked for
+        from copy import copy
+
+        self.resolve_collisions()
+        other = copy(self)
+        other.collision_spans = []
+        other.timer = timer
+        other.controller = controller
+        other.screen = None
+        other.audio = None
+        other.play_audio = False
+        other.sound0 = self.sound0[:]
+        other.sound1 = self.sound1[:]
+        other.canvas = np.zeros(self.canvas_pixels, dtype="int32")
+        other.frame = self.frame.copy() if frame_buffer else np.zeros(self.canvas_pixels, dtype="int32")
+        other.cur_line2 = self.cur_line2.copy()
+        other.cur_line = np.split(other.cur_line2, [68])[1]
+        other.pf_tmp = self.pf_tmp.copy()
+        other.write_table = other.get_write_table()
+        other.set_renderer()
+        return other
+
+    def save_state(self, frame_buffer=False):
+        # registers, sound, playfield, the decoded sprites (they aren't always redecoded when
+        # what they're made from changes) and the line being drawn
+        self.resolve_collisions()
+        if self.line_dirty:
+            self.compose_line()
+        out = [
+            self.state_format.pack(*[getattr(self, name) for name in self.state_names]),
+            bytes(self.sound0 + self.sound1),
+            self.pf_tmp.tobytes(),
+            np.packbits(self.decoded_p0).tobytes(),
+            np.packbits(self.decoded_p1).tobytes(),
+            np.packbits(self.decoded_pf).tobytes(),
+            self.cur_line.tobytes()
+        ]
+        if frame_buffer:
+            out.append(self.canvas.tobytes())
+            out.append(self.frame.tobytes())
+        return b"".join(out)
+
+    def load_state(self, data):
+        for name, value in zip(self.state_names, self.state_format.unpack_from(data)):
+            setattr(self, name, value)
+        offset = self.state_format.size
+        self.sound0[:] = data[offset:offset + 3]
+        self.sound1[:] = data[offset + 3:offset + 6]
+        self.pf_tmp[:] = np.frombuffer(data, "uint8", 3, offset + 6)
+        offset += 9
+        self.decoded_p0 = np.unpackbits(np.frombuffer(data, "uint8", 20, offset)).astype("int8")
+        self.decoded_p1 = np.unpackbits(np.frombuffer(data, "uint8", 20, offset + 20)).astype("int8")
+        self.decoded_pf = np.unpackbits(np.frombuffer(data, "uint8", 20, offset + 40)).astype("int8")
+        offset += 60
+        self.collision_spans.clear()
+        self.collision_key = None
+        self.cur_line[:] = np.frombuffer(data, "int32", len(self.cur_line), offset)
+        self.line_dirty = False
+        offset += self.cur_line.nbytes
+        if len(data) > offset:
+            self.canvas[:] = np.frombuffer(data, "int32", self.canvas_pixels, offset)
+            self.frame[:] = np.frombuffer(data, "int32", self.canvas_pixels, offset + self.canvas.nbytes)
+        else:
+            self.canvas.fill(0)
+
     def init(self):
-        pygame.init()
-        pygame.event.set_allowed([pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP])
-        self.screen = pygame.display.set_mode(self.picture_dims)
-        pygame.display.set_caption("Atari 2600")
-        self.background = pygame.Surface((self.line_width, self.height))
-        self.background = self.background.convert()
+        if self.display:
+            from screen import Screen
+            self.screen = Screen(self.line_width, self.width, self.height)
 
     def write_v_sync(self, value):
         if value & 0x2 != self.v_sync:
@@ -243,13 +365,15 @@ class Tia:
     def write_ref_p0(self, value):
         self.update(1)
         self.p0_reflected = value & 0x8
-        self.decode_player(self.decoded_p0, self.p0_graphics, self.p0_reflected, self.p0_size, self.p0_draw_time)
+        self.decoded_p0 = self.decode_player(self.p0_graphics, self.p0_reflected, self.p0_size,
+                                             self.p0_draw_time)
         self.draw_line()
 
     def write_ref_p1(self, value):
         self.update(1)
         self.p1_reflected = value & 0x8
-        self.decode_player(self.decoded_p1, self.p1_graphics, self.p1_reflected, self.p1_size, self.p1_draw_time)
+        self.decoded_p1 = self.decode_player(self.p1_graphics, self.p1_reflected, self.p1_size,
+                                             self.p1_draw_time)
         self.draw_line()
 
     def write_pf0(self, value):
@@ -317,14 +441,16 @@ class Tia:
         if self.p0_graphics != value:
             self.update(1)
             self.p0_graphics = value
-            self.decode_player(self.decoded_p0, self.p0_graphics, self.p0_reflected, self.p0_size, self.p0_draw_time)
+            self.decoded_p0 = self.decode_player(self.p0_graphics, self.p0_reflected, self.p0_size,
+                                                 self.p0_draw_time)
             self.draw_line()
 
     def write_gr_p1(self, value):
         if self.p1_graphics != value:
             self.update(1)
             self.p1_graphics = value
-            self.decode_player(self.decoded_p1, self.p1_graphics, self.p1_reflected, self.p1_size, self.p1_draw_time)
+            self.decoded_p1 = self.decode_player(self.p1_graphics, self.p1_reflected, self.p1_size,
+                                                 self.p1_draw_time)
             self.draw_line()
 
     def write_ena_m0(self, value):
@@ -398,8 +524,10 @@ class Tia:
         self.m1_draw_time -= self.m1_hm
         self.bl_draw_time -= self.bl_hm
 
-        self.decode_player(self.decoded_p0, self.p0_graphics, self.p0_reflected, self.p0_size, self.p0_draw_time)
-        self.decode_player(self.decoded_p1, self.p1_graphics, self.p1_reflected, self.p1_size, self.p1_draw_time)
+        self.decoded_p0 = self.decode_player(self.p0_graphics, self.p0_reflected, self.p0_size,
+                                             self.p0_draw_time)
+        self.decoded_p1 = self.decode_player(self.p1_graphics, self.p1_reflected, self.p1_size,
+                                             self.p1_draw_time)
         self.draw_line()
 
     def write_h_move_clear(self, _):
@@ -410,6 +538,8 @@ class Tia:
         self.bl_hm = 0
 
     def write_collisions_clear(self, _):
+        self.collision_spans.clear()
+        self.collision_key = None
         self.collision0 = 0
         self.collision1 = 0
         self.collision2 = 0
@@ -421,6 +551,8 @@ class Tia:
 
     def read(self, address):
         address &= 0xf
+        if address < 0x8 and self.collision_spans:
+            self.resolve_collisions()
         if address == 0x0:
             return self.collision0
         elif address == 0x1:
@@ -465,17 +597,32 @@ class Tia:
                 self.sound0,
                 self.sound1
             )
-        self.controller.process_events(pygame.event.get())
+        if self.screen is not None:
+            self.controller.process_events(self.screen.get_events())
+            if self.rendering:
+                self.screen.show(self.canvas)
 
-        pygame.surfarray.blit_array(self.background, self.canvas.reshape((self.line_width, self.height), order="F"))
-        self.screen.blit(pygame.transform.scale(self.background, self.scaling_dims), (0, 0), self.cropping_dims)
-        pygame.display.flip()
+        self.finish_frame()
 
-        self.canvas.fill(0)
+    def finish_frame(self):
+        # keep the finished picture in self.frame and start the next one on the other buffer
+        if self.rendering:
+            self.canvas, self.frame = self.frame, self.canvas
+            self.canvas.fill(0)
 
         self.timer.frame_done = True
 
     def draw_line(self):
+        self.compose_line()
+        self.record_collisions()
+
+    def mark_line(self):
+        # draw_line with lazy_compose and with rendering off
+        self.line_dirty = True
+        self.record_collisions()
+
+    def compose_line(self):
+        self.line_dirty = False
         if self.pf_priority:
             self.cur_line.fill(self.color_bk)
             self.draw_p1()
@@ -492,8 +639,6 @@ class Tia:
             self.draw_p0()
             self.draw_m0()
 
-        self.calculate_collisions()
-
     def update(self, delay):
         pixels = self.timer.time - self.timer.tia_last_update + delay
         if not self.v_blank and self.current_pixel + pixels < self.canvas_pixels:
@@ -514,26 +659,71 @@ class Tia:
         self.timer.tia_last_update = self.timer.time + delay
         self.current_pixel += pixels
 
-    def decode_pf(self):
-        self.combined_pf[:20] = np.unpackbits(self.pf_tmp, bitorder="little")[4:]
-
-        # pf1 flipped
-        self.combined_pf[4:12] = self.combined_pf[11:3:-1]
+    def skip_update(self, delay):
+        # update with rendering off, only the beam moves on
+        self.current_pixel += self.timer.time - self.timer.tia_last_update + delay
+        self.timer.tia_last_update = self.timer.time + delay
 
-        if self.pf_reflected:
-            self.combined_pf[20:] = self.combined_pf[19::-1]
+    def update_lazy(self, delay):
+        # update with lazy_compose, the line is only composed when visible pixels are
+        # copied from it (the horizontal blank is always 0 in both cur_line2 and the canvas)
+        pixels = self.timer.time - self.timer.tia_last_update + delay
+        if pixels > 0 and not self.v_blank and self.current_pixel % self.line_width + pixels > 68:
+            if self.line_dirty:
+                self.compose_line()
+            Tia.update(self, delay)
         else:
-            self.combined_pf[20:] = self.combined_pf[:20]
-
-        self.decoded_pf = self.combined_pf.repeat(4)
+            self.timer.tia_last_update = self.timer.time + delay
+            self.current_pixel += pixels
 
+    def decode_pf(self):
+        self.decoded_pf = self.decode_playfield(self.pf_tmp.tobytes(), self.pf_reflected)
         self.draw_line()
 
-    def decode_player(self, out, graphics, is_reflected, size, draw_time):
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def decode_playfield(pf, reflected):
+        # pf is PF0, PF1 and PF2 as bytes, the 160 pixel result is shared so it's read-only
+        combined_pf = np.zeros(40, dtype="int8")
+        combined_pf[:20] = np.unpackbits(np.frombuffer(pf, dtype="uint8"), bitorder="little")[4:]
+
+        # pf1 flipped
+        combined_pf[4:12] = combined_pf[11:3:-1]
+
+        if reflected:
+            combined_pf[20:] = combined_pf[19::-1]
+        else:
+            combined_pf[20:] = combined_pf[:20]
+
+        decoded = combined_pf.repeat(4)
+        decoded.flags.writeable = False
+        return decoded
+
+    def decode_player(self, graphics, is_reflected, size, draw_time):
+        if draw_time >= 0:
+            mask = self.player_masks.get((graphics, is_reflected, size))
+            if mask is None:
+                mask = np.tile(self.draw_player(graphics, is_reflected, size, 0), 2)
+                mask.flags.writeable = False
+                self.player_masks[graphics, is_reflected, size] = mask
+            start = 160 - draw_time % 160
+            return mask[start:start + 160]
+
+        key = (graphics, is_reflected, size, draw_time)
+        mask = self.edge_player_masks.get(key)
+        if mask is None:
+            if len(self.edge_player_masks) > 4096:
+                self.edge_player_masks.clear()
+            mask = self.draw_player(graphics, is_reflected, size, draw_time)
+            mask.flags.writeable = False
+            self.edge_player_masks[key] = mask
+        return mask
+
+    def draw_player(self, graphics, is_reflected, size, draw_time):
         tmp = np.unpackbits(np.array(graphics, dtype="uint8"))
         if is_reflected:
             tmp = tmp[::-1]
-        out.fill(0)
+        out = np.zeros(160, dtype="int8")
         if not size:  # one copy
             self.decode_player2(out, tmp, draw_time)
         elif size == 1:  # two copies - close
@@ -557,6 +747,7 @@ class Tia:
             self.decode_player2(out, tmp, draw_time + 0x40)
         elif size == 7:  # quad sized player
             self.decode_player2(out, tmp.repeat(4), draw_time + 0x1)
+        return out
 
     def draw_pf(self):
         if self.pf_score:
@@ -603,64 +794,91 @@ class Tia:
     def draw_sprite_simple(self, graphics, time, color):
         time = max(time, 0)
         if 160 - (time + graphics) >= 0:
-            self.cur_line[time:time + graphics] = [color] * graphics
-
-    def calculate_collisions(self):  # a mess
-        p0 = not not self.p0_graphics
-        p1 = not not self.p1_graphics
-        m0 = not not self.m0_enabled
-        m1 = not not self.m1_enabled
-        bl = not not self.bl_enabled
-
-        if p0:
-            if p1:
-                if (self.decoded_p0 & self.decoded_p1).any():
+            self.cur_line[time:time + graphics] = color
+
+    def record_collisions(self):
+        # most games read the collision registers once a frame, if at all, so instead of working
+        # them out on every write this keeps each different set of objects that was drawn and
+        # resolve_collisions goes through them when they're read (the decoded arrays are never
+        # changed in place, so keeping them is enough)
+        p0 = self.decoded_p0 if self.p0_graphics else None
+        p1 = self.decoded_p1 if self.p1_graphics else None
+        m0 = (self.collision_m0, self.m0_draw_time) if self.m0_enabled else None
+        m1 = (self.collision_m1, self.m1_draw_time) if self.m1_enabled else None
+        bl = (self.collision_bl, self.bl_draw_time) if self.bl_enabled else None
+        if p0 is None and p1 is None and m0 is None and m1 is None and bl is None:
+            return
+        key = (id(p0), id(p1), id(self.decoded_pf), m0, m1, bl)
+        if key != self.collision_key:
+            self.collision_key = key
+            self.collision_spans.append((p0, p1, self.decoded_pf, m0, m1, bl))
+            if len(self.collision_spans) > 512:  # never read or cleared
+                self.resolve_collisions()
+
+    def resolve_collisions(self):
+        for span in self.collision_spans:
+            self.calculate_collisions(*span)
+        self.collision_spans.clear()
+        self.collision_key = None
+
+    def calculate_collisions(self, p0, p1, pf, m0, m1, bl):  # a mess
+        # pairs whose bit is already set are skipped
+        collision_with_pf = self.collision_with_pf
+
+        if p0 is not None:
+            if p1 is not None and not self.collision7 & 0x80:
+                if (p0 & p1).any():
                     self.collision7 |= 0x80  # P0 P1
-            if m0:
-                if self.collision_with_pf(self.decoded_p0, self.collision_m0, self.m0_draw_time):
+            if m0 and not self.collision0 & 0x40:
+                if collision_with_pf(p0, *m0):
                     self.collision0 |= 0x40  # M0 P0
-            if m1:
-                if self.collision_with_pf(self.decoded_p0, self.collision_m1, self.m1_draw_time):
+            if m1 and not self.collision1 & 0x80:
+                if collision_with_pf(p0, *m1):
                     self.collision1 |= 0x80  # M1 P0
-            if bl:
-                if self.collision_with_pf(self.decoded_p0, self.collision_bl, self.bl_draw_time):
+            if bl and not self.collision2 & 0x40:
+                if collision_with_pf(p0, *bl):
                     self.collision2 |= 0x40  # P0 BL
-            if (self.decoded_p0 & self.decoded_pf).any():
-                self.collision2 |= 0x80  # P0 PF
+            if not self.collision2 & 0x80:
+                if (p0 & pf).any():
+                    self.collision2 |= 0x80  # P0 PF
 
-        if p1:
-            if m0:
-                if self.collision_with_pf(self.decoded_p1, self.collision_m0, self.m0_draw_time):
+        if p1 is not None:
+            if m0 and not self.collision0 & 0x80:
+                if collision_with_pf(p1, *m0):
                     self.collision0 |= 0x80  # M0 P1
-            if m1:
-                if self.collision_with_pf(self.decoded_p1, self.collision_m1, self.m1_draw_time):
+            if m1 and not self.collision1 & 0x40:
+                if collision_with_pf(p1, *m1):
                     self.collision1 |= 0x40  # M1 P1
-            if bl:
-                if self.collision_with_pf(self.decoded_p1, self.collision_bl, self.bl_draw_time):
+            if bl and not self.collision3 & 0x40:
+                if collision_with_pf(p1, *bl):
                     self.collision3 |= 0x40  # P1 BL
-            if (self.decoded_p1 & self.decoded_pf).any():
-                self.collision3 |= 0x80  # P1 PF
+            if not self.collision3 & 0x80:
+                if (p1 & pf).any():
+                    self.collision3 |= 0x80  # P1 PF
 
         if m0:
             if m1:
-                if (self.collision_m0 << abs(self.m0_draw_time - self.m1_draw_time)) & self.collision_m1:
+                if (m0[0] << abs(m0[1] - m1[1])) & m1[0]:
                     self.collision7 |= 0x40  # M0 M1
             if bl:
-                if (self.collision_m0 << abs(self.m0_draw_time - self.bl_draw_time)) & self.collision_bl:
+                if (m0[0] << abs(m0[1] - bl[1])) & bl[0]:
                     self.collision4 |= 0x40  # M0 BL
-            if self.collision_with_pf(self.decoded_pf, self.collision_m0, self.m0_draw_time):
-                self.collision4 |= 0x80  # M0 PF
+            if not self.collision4 & 0x80:
+                if collision_with_pf(pf, *m0):
+                    self.collision4 |= 0x80  # M0 PF
 
         if m1:
             if bl:
-                if (self.collision_m1 << abs(self.m1_draw_time - self.bl_draw_time)) & self.collision_bl:
+                if (m1[0] << abs(m1[1] - bl[1])) & bl[0]:
                     self.collision5 |= 0x40  # M1 BL
-            if self.collision_with_pf(self.decoded_pf, self.collision_m1, self.m1_draw_time):
-                self.collision5 |= 0x80  # M1 PF
+            if not self.collision5 & 0x80:
+                if collision_with_pf(pf, *m1):
+                    self.collision5 |= 0x80  # M1 PF
 
         if bl:
-            if self.collision_with_pf(self.decoded_pf, self.collision_bl, self.bl_draw_time):
-                self.collision6 |= 0x80  # BL PF
+            if not self.collision6 & 0x80:
+                if collision_with_pf(pf, *bl):
+                    self.collision6 |= 0x80  # BL PF
 
     @staticmethod
     def collision_with_pf(arr, x, x_offset):
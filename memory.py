@@ -1,3 +1,6 @@
+from hashlib import sha1
+
+
 class Memory:
     """
     supported bank-switching methods:
@@ -20,31 +23,51 @@ class Memory:
     EF -- TODO
     """
 
-    def __init__(self, timer, controller, tia, settings):
+    # rom offsets where a read switches banks, by bank-switching method
+    hotspots = {
+        "f8": range(0xFF8, 0xFFA),
+        "e0": range(0xFE0, 0xFF8),
+        "fa": range(0xFF8, 0xFFB),
+        "f6": range(0xFF6, 0xFFA),
+        "f4": range(0xFF4, 0xFFC),
+        "ef": range(0xFE0, 0xFF0),
+    }
+
+    def __init__(self, timer, controller, tia, rom_filepath, bank_switching="", super_chip=False):
         self.controller = controller
         self.timer = timer
-        with open(settings.rom_filepath, "rb") as file:
+        with open(rom_filepath, "rb") as file:
             self.rom = file.read()
+        # identifies the rom for the block cache and movies
+        self.rom_sha1 = sha1(self.rom).hexdigest()
 
         self.rom_size = len(self.rom)
 
-        if settings.rom_super_chip == "yes":
-            self.super_chip = True
-        elif settings.rom_super_chip == "no":
-            self.super_chip = False
-        else:
-            self.super_chip = False
+        self.super_chip = super_chip
 
         self.banks = []
         self.cur_bank = self.rom
-        self.read = self.read_4k
-        self.write = self.write_other
-        self.get_bank_switching_method(settings.rom_bank_switching)
+        self.bank_key = 0
+        # the cartridge's whole read and write, only called for the pages that need them
+        self.read_cartridge = self.read_4k
+        self.write_cartridge = self.write_other
+        self.get_bank_switching_method(bank_switching)
+        self.method = self.read_cartridge.__name__[-2:]
 
         if self.super_chip:
-            print(f"BANKSWITCHING METHOD: {self.read.__name__[-2:]} -- SUPERCHIP ENABLED")
+            print(f"BANKSWITCHING METHOD: {self.method} -- SUPERCHIP ENABLED")
         else:
-            print(f"BANKSWITCHING METHOD: {self.read.__name__[-2:]}")
+            print(f"BANKSWITCHING METHOD: {self.method}")
+
+        # offsets into the rom that don't just read the rom byte
+        self.hotspots = set(self.hotspots.get(self.method, ()))
+        self.ram_ports = set()
+        if self.method == "fa":
+            self.ram_ports.update(range(0x100, 0x200))
+        elif self.super_chip and self.method in ("f6", "f4", "ef"):
+            self.ram_ports.update(range(0x80, 0x100))
+        self.tia = tia
+        self.set_pages()
 
         if self.super_chip:
             self.sc_ram = [0] * 128
@@ -55,7 +78,6 @@ class Memory:
         self.rom_break_vector = self.read2(0xFFFE)
 
         self.ram = [0] * 128
-        self.tia = tia
 
         self.time_multiple = 1
 
@@ -68,7 +90,7 @@ class Memory:
         if settings_value != "":
             # 2k
             if settings_value == "2k":
-                self.read = self.read_2k
+                self.read_cartridge = self.read_2k
             # 4k
             elif settings_value == "4k":
                 pass  # default
@@ -77,7 +99,11 @@ class Memory:
                 self.set_banks(self.read_8k_f8, self.write_8k_f8)
             elif settings_value == "e0":
                 self.set_banks(self.read_8k_e0, self.write_8k_e0, bank_size=1024)
-                self.rom = self.banks[0] + self.banks[0] + self.banks[0] + self.banks[7]
+                # the 4k the cpu sees, segments are copied into it when they are switched
+                self.rom = bytearray(self.banks[0] + self.banks[0] + self.banks[0] + self.banks[7])
+                self.cur_bank = self.rom
+                self.segments = [0, 0, 0]
+                self.bank_key = 0
             # 12k
             elif settings_value == "fa":
                 self.set_banks(self.read_12k_fa, self.write_12k_fa)
@@ -97,7 +123,7 @@ class Memory:
         else:
             # unknown method, guess based on size
             if self.rom_size == 2048:
-                self.read = self.read_2k
+                self.read_cartridge = self.read_2k
             elif self.rom_size == 4096:
                 pass  # default
             elif self.rom_size == 8192:
@@ -116,67 +142,208 @@ class Memory:
     def set_banks(self, read_func, write_func, bank_size=4096):
         for i in range(self.rom_size // bank_size):
             self.banks.append(self.rom[i * bank_size: (i + 1) * bank_size])
-        self.cur_bank = self.banks[0]
-        self.read = read_func
-        self.write = write_func
+        self.switch_bank(0)
+        self.read_cartridge = read_func
+        self.write_cartridge = write_func
+
+    def set_pages(self):
+        # the 8k address bus in 64 byte pages, each with the function that reads or writes it,
+        # None for rom pages that are just the mapped bank (or writes that do nothing)
+        self.rom_mask = 0x7FF if self.method == "2k" else 0xFFF
+        special = {(offset | 0x1000) >> 6 for offset in self.hotspots | self.ram_ports}
+        if self.method == "fa":
+            special.update(range(0x1000 >> 6, 0x1100 >> 6))  # super-chip ram writes
+        elif self.super_chip and self.method in ("f6", "f4", "ef"):
+            special.update(range(0x1000 >> 6, 0x1080 >> 6))
+
+        self.read_pages = []
+        self.write_pages = []
+        for page in range(0x80):
+            address = page << 6
+            if address & 0x1000:
+                self.read_pages.append(self.read_cartridge if page in special else None)
+                if self.write_cartridge == self.write_other:
+                    # 4k and 2k carts ignore a12 on writes
+                    self.write_pages.append(self.write_pages[page & 0x3F])
+                elif self.method == "ef":
+                    # its hotspot test takes in most of the rom
+                    self.write_pages.append(self.write_cartridge)
+                else:
+                    self.write_pages.append(self.write_cartridge if page in special else None)
+            elif address & 0x200:
+                self.read_pages.append(self.read_riot)
+                self.write_pages.append(self.write_riot)
+            elif address & 0x80:
+                self.read_pages.append(self.read_ram)
+                self.write_pages.append(self.write_ram)
+            else:
+                self.read_pages.append(self.tia.read)
+                self.write_pages.append(self.write_tia)
+
+    def read(self, address):
+        handler = self.read_pages[(address >> 6) & 0x7F]
+        if handler is None:
+            return self.cur_bank[address & self.rom_mask]
+        return handler(address)
+
+    def write(self, address, value):
+        handler = self.write_pages[(address >> 6) & 0x7F]
+        if handler is not None:
+            handler(address, value)
+
+    def switch_bank(self, bank):
+        self.cur_bank = self.banks[bank]
+        # bank_key names what is mapped in, the recompiler caches blocks by it
+        self.bank_key = bank % len(self.banks)
+
+    def get_mapped_rom(self, bank_key):
+        # the 4k the cpu sees for a bank_key
+        if hasattr(self, "segments"):
+            segments = (bank_key & 0x7, (bank_key >> 3) & 0x7, bank_key >> 6)
+            return b"".join(self.banks[i] for i in segments) + self.banks[7]
+        elif self.banks:
+            return self.banks[bank_key]
+        return self.rom
 
     def swap_slice(self, old, new, size):
-        self.rom = self.rom[:(old - 0) * size] + self.banks[new] + self.rom[(old + 1) * size:]
+        self.rom[old * size:(old + 1) * size] = self.banks[new]
+        self.segments[old] = new
+        self.bank_key = self.segments[0] | self.segments[1] << 3 | self.segments[2] << 6
+
+    def clone(self, timer, controller, tia):
+        # shares the rom and banks, copies the ram and whatever is switched in
+        from copy import copy
+
+        other = copy(self)
+        other.timer = timer
+        other.controller = controller
+        other.tia = tia
+        other.ram = self.ram[:]
+        if hasattr(self, "sc_ram"):
+            other.sc_ram = self.sc_ram[:]
+        if hasattr(self, "segments"):
+            other.rom = other.cur_bank = bytearray(self.rom)
+            other.segments = self.segments[:]
+        other.read_cartridge = getattr(other, self.read_cartridge.__name__)
+        other.write_cartridge = getattr(other, self.write_cartridge.__name__)
+
+        # the page tables only hold a few different handlers, bind each to the copies once
+        owners = {self: other, self.tia: tia}
+        rebound = {None: None}
+        for handler in set(self.read_pages + self.write_pages) - {None}:
+            rebound[handler] = handler.__func__.__get__(owners[handler.__self__])
+        other.read_pages = [rebound[handler] for handler in self.read_pages]
+        other.write_pages = [rebound[handler] for handler in self.write_pages]
+        return other
+
+    def save_state(self):
+        # ram, super-chip ram, the riot port masks and what is mapped in
+        if hasattr(self, "segments"):
+            mapping = bytes(self.segments)
+        else:
+            mapping = bytes((self.bank_key,))
+        return b"".join((
+            bytes(self.ram),
+            bytes(getattr(self, "sc_ram", ())),
+            bytes((self.input_a_mask, self.input_b_mask)),
+            mapping
+        ))
+
+    def load_state(self, data):
+        self.ram[:] = data[:128]
+        offset = 128
+        if hasattr(self, "sc_ram"):
+            self.sc_ram[:] = data[offset:offset + len(self.sc_ram)]
+            offset += len(self.sc_ram)
+        self.input_a_mask, self.input_b_mask = data[offset:offset + 2]
+        offset += 2
+        if hasattr(self, "segments"):
+            for segment, bank in enumerate(data[offset:offset + 3]):
+                self.swap_slice(segment, bank, 1024)
+        elif self.banks:
+            self.switch_bank(data[offset])
 
     def read_other(self, address):
         if address & 0x200:  # RIOT registers
-            address &= 0x7F
-            if address == 0x0:  # input_a
-                return self.controller.input_a & ~self.input_a_mask
-            elif address == 0x1:
-                return self.input_a_mask
-            elif address == 0x2:  # input_b
-                return self.controller.input_b & ~self.input_b_mask
-            elif address == 0x3:
-                return self.input_b_mask
-            elif address == 0x4 or address == 0x6:  # timer output
-                self.timer.update_riot_timer()
-                self.timer.riot_status &= ~0x80
-                return self.timer.riot_timer
-            elif address == 0x5 or address == 0x7:  # timer interrupt
-                self.timer.update_riot_timer()
-                tmp = self.timer.riot_status
-                self.timer.riot_status &= ~0x40
-                return tmp
-            return 0
+            return self.read_riot(address)
         elif address & 0x80:  # RAM
             return self.ram[address & 0x7F]
         else:  # TIA registers
             return self.tia.read(address)
 
+    def read_riot(self, address):
+        address &= 0x7F
+        if address == 0x0:  # input_a
+            return self.controller.input_a & ~self.input_a_mask
+        elif address == 0x1:
+            return self.input_a_mask
+        elif address == 0x2:  # input_b
+            return self.controller.input_b & ~self.input_b_mask
+        elif address == 0x3:
+            return self.input_b_mask
+        elif address == 0x4 or address == 0x6:  # timer output
+            self.timer.update_riot_timer()
+            self.timer.riot_status &= ~0x80
+            return self.timer.riot_timer
+        elif address == 0x5 or address == 0x7:  # timer interrupt
+            self.timer.update_riot_timer()
+            tmp = self.timer.riot_status
+            self.timer.riot_status &= ~0x40
+            return tmp
+        return 0
+
+    def read_ram(self, address):
+        return self.ram[address & 0x7F]
+
     def write_other(self, address, value):
         if address & 0x200:  # RIOT registers
-            address &= 0x7f
-            if address == 0x0:  # write to input_a
-                print(value)
-            elif address == 0x1:  # input_a DDR
-                self.input_a_mask = value
-            elif address == 0x14:  # Tim1t
-                self.timer.update_riot_timer()
-                self.timer.set_riot_timer(value, 1)
-            elif address == 0x15:  # Tim8t
-                self.timer.update_riot_timer()
-                self.timer.set_riot_timer(value, 8)
-            elif address == 0x16:  # Tim64t
-                self.timer.update_riot_timer()
-                self.timer.set_riot_timer(value, 64)
-            elif address == 0x17:  # T1024t
-                self.timer.update_riot_timer()
-                self.timer.set_riot_timer(value, 1024)
+            self.write_riot(address, value)
         elif address & 0x80:  # RAM
             self.ram[address & 0x7F] = value
         else:  # TIA registers
-            try:
-                self.tia.write_table[address](value)
-            except KeyError:
-                pass
+            self.write_tia(address, value)
+
+    def write_riot(self, address, value):
+        address &= 0x7f
+        if address == 0x0:  # write to input_a
+            print(value)
+        elif address == 0x1:  # input_a DDR
+            self.input_a_mask = value
+        elif address == 0x14:  # Tim1t
+            self.timer.update_riot_timer()
+            self.timer.set_riot_timer(value, 1)
+        elif address == 0x15:  # Tim8t
+            self.timer.update_riot_timer()
+            self.timer.set_riot_timer(value, 8)
+        elif address == 0x16:  # Tim64t
+            self.timer.update_riot_timer()
+            self.timer.set_riot_timer(value, 64)
+        elif address == 0x17:  # T1024t
+            self.timer.update_riot_timer()
+            self.timer.set_riot_timer(value, 1024)
+
+    def write_ram(self, address, value):
+        self.ram[address & 0x7F] = value
+
+    def write_tia(self, address, value):
+        try:
+            self.tia.write_table[address](value)
+        except KeyError:
+            pass
+
+    def peek(self, address):
+        # rom byte at address without reading it, None if reading it does more than that
+        offset = address & 0xFFF
+        if not address & 0x1000 or address > 0xFFFF or offset in self.hotspots or offset in self.ram_ports:
+            return None
+        return self.cur_bank[address & (len(self.cur_bank) - 1)]
 
     def read2(self, address):
+        if self.read_pages[(address >> 6) & 0x7F] is None and address & 0x3F != 0x3F:
+            # both bytes on the same rom page
+            bank = self.cur_bank
+            address &= self.rom_mask
+            return bank[address] | bank[address + 1] << 8
         return self.read(address) + (self.read(address + 1) << 8)
 
     def read_2k(self, address):
@@ -195,9 +362,9 @@ class Memory:
         if address & 0x1000:
             address &= 0xFFF
             if address == 0xFF8:
-                self.cur_bank = self.banks[0]
+                self.switch_bank(0)
             elif address == 0xFF9:
-                self.cur_bank = self.banks[1]
+                self.switch_bank(1)
             return self.cur_bank[address]
         else:
             return self.read_other(address)
@@ -206,9 +373,9 @@ class Memory:
         if address & 0x1000:
             address &= 0xFFF
             if address == 0xFF8:
-                self.cur_bank = self.banks[0]
+                self.switch_bank(0)
             elif address == 0xFF9:
-                self.cur_bank = self.banks[1]
+                self.switch_bank(1)
         else:
             self.write_other(address, value)
 
@@ -243,11 +410,11 @@ class Memory:
             if address & 0xF00 == 0x100:
                 return self.sc_ram[address & 0xFF]
             if address == 0xFF8:
-                self.cur_bank = self.banks[0]
+                self.switch_bank(0)
             elif address == 0xFF9:
-                self.cur_bank = self.banks[1]
+                self.switch_bank(1)
             elif address == 0xFFA:
-                self.cur_bank = self.banks[2]
+                self.switch_bank(2)
             return self.cur_bank[address]
         else:
             return self.read_other(address)
@@ -258,11 +425,11 @@ class Memory:
             if address & 0xF00 == 0:
                 self.sc_ram[address & 0xFF] = value
             if address == 0xFF8:
-                self.cur_bank = self.banks[0]
+                self.switch_bank(0)
             elif address == 0xFF9:
-                self.cur_bank = self.banks[1]
+                self.switch_bank(1)
             elif address == 0xFFA:
-                self.cur_bank = self.banks[2]
+                self.switch_bank(2)
         else:
             self.write_other(address, value)
 
@@ -273,13 +440,13 @@ class Memory:
                 if address & 0xF80 == 0x80:
                     return self.sc_ram[address & 0x7F]
             if address == 0xFF6:
-                self.cur_bank = self.banks[0]
+                self.switch_bank(0)
             elif address == 0xFF7:
-                self.cur_bank = self.banks[1]
+                self.switch_bank(1)
             elif address == 0xFF8:
-                self.cur_bank = self.banks[2]
+                self.switch_bank(2)
             elif address == 0xFF9:
-                self.cur_bank = self.banks[3]
+                self.switch_bank(3)
             return self.cur_bank[address]
         else:
             return self.read_other(address)
@@ -291,13 +458,13 @@ class Memory:
                 if address & 0xF80 == 0:
                     self.sc_ram[address & 0x7F] = value
             if address == 0xFF6:
-                self.cur_bank = self.banks[0]
+                self.switch_bank(0)
             elif address == 0xFF7:
-                self.cur_bank = self.banks[1]
+                self.switch_bank(1)
             elif address == 0xFF8:
-                self.cur_bank = self.banks[2]
+                self.switch_bank(2)
             elif address == 0xFF9:
-                self.cur_bank = self.banks[3]
+                self.switch_bank(3)
         else:
             self.write_other(address, value)
 
@@ -308,21 +475,21 @@ class Memory:
                 if address & 0xF80 == 0x80:
                     return self.sc_ram[address & 0x7F]
             if address == 0xFF4:
-                self.cur_bank = self.banks[0]
+                self.switch_bank(0)
             elif address == 0xFF5:
-                self.cur_bank = self.banks[1]
+                self.switch_bank(1)
             elif address == 0xFF6:
-                self.cur_bank = self.banks[2]
+                self.switch_bank(2)
             elif address == 0xFF7:
-                self.cur_bank = self.banks[3]
+                self.switch_bank(3)
             elif address == 0xFF8:
-                self.cur_bank = self.banks[4]
+                self.switch_bank(4)
             elif address == 0xFF9:
-                self.cur_bank = self.banks[5]
+                self.switch_bank(5)
             elif address == 0xFFA:
-                self.cur_bank = self.banks[6]
+                self.switch_bank(6)
             elif address == 0xFFB:
-                self.cur_bank = self.banks[7]
+                self.switch_bank(7)
             return self.cur_bank[address]
         else:
             return self.read_other(address)
@@ -334,21 +501,21 @@ class Memory:
                 if address & 0xF80 == 0:
                     self.sc_ram[address & 0x7F] = value
             if address == 0xFF4:
-                self.cur_bank = self.banks[0]
+                self.switch_bank(0)
             elif address == 0xFF5:
-                self.cur_bank = self.banks[1]
+                self.switch_bank(1)
             elif address == 0xFF6:
-                self.cur_bank = self.banks[2]
+                self.switch_bank(2)
             elif address == 0xFF7:
-                self.cur_bank = self.banks[3]
+                self.switch_bank(3)
             elif address == 0xFF8:
-                self.cur_bank = self.banks[4]
+                self.switch_bank(4)
             elif address == 0xFF9:
-                self.cur_bank = self.banks[5]
+                self.switch_bank(5)
             elif address == 0xFFA:
-                self.cur_bank = self.banks[6]
+                self.switch_bank(6)
             elif address == 0xFFB:
-                self.cur_bank = self.banks[7]
+                self.switch_bank(7)
         else:
             self.write_other(address, value)
 
@@ -359,7 +526,7 @@ class Memory:
                 if address & 0xF80 == 0x80:
                     return self.sc_ram[address & 0x7F]
             if 0xFE0 <= address <= 0xFEF:
-                self.cur_bank = self.banks[address - 0xFE0]
+                self.switch_bank(address - 0xFE0)
             return self.cur_bank[address]
         else:
             return self.read_other(address)
@@ -371,6 +538,6 @@ class Memory:
                 if address & 0xF80 == 0:
                     self.sc_ram[address & 0x7F] = value
             if 0xFE0 >= address <= 0xFEF:
-                self.cur_bank = self.banks[address - 0xFE0]
+                self.switch_bank(address - 0xFE0)
         else:
             self.write_other(address, value)
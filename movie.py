@@ -0,0 +1,118 @@
+# records the controller (joysticks, paddles and console switches) every frame so a session
+# can be replayed exactly, with a save state every keyframe_interval frames so a replay can
+# start from the middle, it only plays back on the rom and bank-switching it was made with
+import struct
+import zlib
+
+
+class Movie:
+    header = struct.Struct("<4sB20s2s?II")
+    magic = b"A26M"
+    version = 2
+
+    def __init__(self, keyframe_interval=600):
+        self.keyframe_interval = keyframe_interval
+        self.inputs = bytearray()  # the 8 controller bytes of every frame
+        self.keyframes = {}  # frame number: save state from just before it
+        self.rom = None  # (rom sha1, bank-switching method, super chip) it was recorded with
+
+    @property
+    def frames(self):
+        return len(self.inputs) // 8
+
+    def capture(self, atari):
+        # call before each frame is run
+        if self.rom is None:
+            self.rom = rom_of(atari)
+        frame = self.frames
+        if frame % self.keyframe_interval == 0:
+            self.keyframes[frame] = atari.save_state()
+        self.inputs += atari.controller.save_state()
+
+    def record(self, atari, step):
+        # wraps a cpu step function (for run_loop) so every frame it runs is captured first
+        def record_step():
+            self.capture(atari)
+            step()
+
+        return record_step
+
+    def seek(self, atari, frame):
+        # puts atari in the state from just before frame, replaying from the keyframe before it
+        if not self.keyframes:
+            raise ValueError("the movie has no recorded frames to seek in")
+        if not 0 <= frame <= self.frames:
+            raise ValueError(f"frame {frame} isn't in the movie (0 to {self.frames})")
+        self.check_rom(atari)
+        keyframe = max(key for key in self.keyframes if key <= frame)
+        atari.load_state(self.keyframes[keyframe])
+        self.play(atari, keyframe, frame)
+
+    def play(self, atari, start=0, end=None):
+        # runs frames start to end with their recorded inputs, atari has to be at start already
+        self.check_rom(atari)
+        controller = atari.controller
+        inputs = self.inputs
+        for frame in range(start, self.frames if end is None else end):
+            controller.load_state(inputs[frame * 8: frame * 8 + 8])
+            atari.run_frames(1)
+
+    def check_rom(self, atari):
+        if self.rom is not None and rom_of(atari) != self.rom:
+            sha, method, super_chip = self.rom
+            raise ValueError(
+                f"movie was recorded on rom {sha[:16]} with {method}{' super chip' if super_chip else ''}"
+                f" bank-switching, not this one"
+            )
+
+    def save(self, path):
+        sha, method, super_chip = self.rom or ("00" * 20, "", False)
+        out = [self.header.pack(
+            self.magic, self.version, bytes.fromhex(sha), method.encode(), super_chip, self.keyframe_interval,
+            self.frames
+        )]
+        inputs = zlib.compress(self.inputs, 9)
+        out.append(struct.pack("<I", len(inputs)))
+        out.append(inputs)
+        out.append(struct.pack("<I", len(self.keyframes)))
+        for frame, state in sorted(self.keyframes.items()):
+            out.append(struct.pack("<II", frame, len(state)))
+            out.append(state)
+        with open(path, "wb") as f:
+            f.write(b"".join(out))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version = struct.unpack_from("<4sB", data)
+        if magic != cls.magic:
+            raise ValueError("not an Atari2600 movie")
+        if version != cls.version:
+            raise ValueError(f"movie version {version} isn't supported (expected {cls.version})")
+        _, _, sha, method, super_chip, keyframe_interval, frames = cls.header.unpack_from(data)
+
+        movie = cls(keyframe_interval)
+        method = method.rstrip(b"\0").decode()
+        if method:
+            movie.rom = sha.hex(), method, super_chip
+        offset = cls.header.size
+        size, = struct.unpack_from("<I", data, offset)
+        offset += 4
+        movie.inputs = bytearray(zlib.decompress(data[offset:offset + size]))
+        offset += size
+        count, = struct.unpack_from("<I", data, offset)
+        offset += 4
+        for _ in range(count):
+            frame, size = struct.unpack_from("<II", data, offset)
+            offset += 8
+            movie.keyframes[frame] = data[offset:offset + size]
+            offset += size
+        if movie.frames != frames:
+            raise ValueError(f"movie has {movie.frames} frames of input, expected {frames}")
+        return movie
+
+
+def rom_of(atari):
+    memory = atari.memory
+    return memory.rom_sha1, memory.method, memory.super_chip
@@ -0,0 +1,274 @@
+# the 6502 instruction set, shared by both cores and the recompiler
+import re
+
+# opcode: (operation, addressing mode, cycles, extra cycle when a page is crossed)
+instructions = {
+    0x00: ("brk", "imp", 7, False),
+    0x01: ("ora", "inx", 6, False),
+    0x05: ("ora", "zp", 3, False),
+    0x06: ("asl", "zp", 5, False),
+    0x08: ("php", "imp", 3, False),
+    0x09: ("ora", "im", 2, False),
+    0x0A: ("asl", "acc", 2, False),
+    0x0D: ("ora", "ab", 4, False),
+    0x0E: ("asl", "ab", 6, False),
+    0x10: ("bpl", "rel", 2, False),
+    0x11: ("ora", "iny", 5, True),
+    0x15: ("ora", "zpx", 4, False),
+    0x16: ("asl", "zpx", 6, False),
+    0x18: ("clc", "imp", 2, False),
+    0x19: ("ora", "aby", 4, True),
+    0x1D: ("ora", "abx", 4, True),
+    0x1E: ("asl", "abx", 7, False),
+    0x20: ("jsr", "ab", 6, False),
+    0x21: ("and", "inx", 6, False),
+    0x24: ("bit", "zp", 3, False),
+    0x25: ("and", "zp", 3, False),
+    0x26: ("rol", "zp", 5, False),
+    0x28: ("plp", "imp", 4, False),
+    0x29: ("and", "im", 2, False),
+    0x2A: ("rol", "acc", 2, False),
+    0x2C: ("bit", "ab", 4, False),
+    0x2D: ("and", "ab", 4, False),
+    0x2E: ("rol", "ab", 6, False),
+    0x30: ("bmi", "rel", 2, False),
+    0x31: ("and", "iny", 5, True),
+    0x35: ("and", "zpx", 4, False),
+    0x36: ("rol", "zpx", 6, False),
+    0x38: ("sec", "imp", 2, False),
+    0x39: ("and", "aby", 4, True),
+    0x3D: ("and", "abx", 4, True),
+    0x3E: ("rol", "abx", 7, False),
+    0x40: ("rti", "imp", 6, False),
+    0x41: ("eor", "inx", 6, False),
+    0x45: ("eor", "zp", 3, False),
+    0x46: ("lsr", "zp", 5, False),
+    0x48: ("pha", "imp", 3, False),
+    0x49: ("eor", "im", 2, False),
+    0x4A: ("lsr", "acc", 2, False),
+    0x4C: ("jmp", "ab", 3, False),
+    0x4D: ("eor", "ab", 4, False),
+    0x4E: ("lsr", "ab", 6, False),
+    0x50: ("bvc", "rel", 2, False),
+    0x51: ("eor", "iny", 5, True),
+    0x55: ("eor", "zpx", 4, False),
+    0x56: ("lsr", "zpx", 6, False),
+    0x58: ("cli", "imp", 2, False),
+    0x59: ("eor", "aby", 4, True),
+    0x5D: ("eor", "abx", 4, True),
+    0x5E: ("lsr", "abx", 7, False),
+    0x60: ("rts", "imp", 6, False),
+    0x61: ("adc", "inx", 6, False),
+    0x65: ("adc", "zp", 3, False),
+    0x66: ("ror", "zp", 5, False),
+    0x68: ("pla", "imp", 4, False),
+    0x69: ("adc", "im", 2, False),
+    0x6A: ("ror", "acc", 2, False),
+    0x6C: ("jmp", "in", 5, False),
+    0x6D: ("adc", "ab", 4, False),
+    0x6E: ("ror", "ab", 6, False),
+    0x70: ("bvs", "rel", 2, False),
+    0x71: ("adc", "iny", 5, True),
+    0x75: ("adc", "zpx", 4, False),
+    0x76: ("ror", "zpx", 6, False),
+    0x78: ("sei", "imp", 2, False),
+    0x79: ("adc", "aby", 4, True),
+    0x7D: ("adc", "abx", 4, True),
+    0x7E: ("ror", "abx", 7, False),
+    0x81: ("sta", "inx", 6, False),
+    0x84: ("sty", "zp", 3, False),
+    0x85: ("sta", "zp", 3, False),
+    0x86: ("stx", "zp", 3, False),
+    0x88: ("dey", "imp", 2, False),
+    0x8A: ("txa", "imp", 2, False),
+    0x8C: ("sty", "ab", 4, False),
+    0x8D: ("sta", "ab", 4, False),
+    0x8E: ("stx", "ab", 4, False),
+    0x90: ("bcc", "rel", 2, False),
+    0x91: ("sta", "iny", 6, False),
+    0x94: ("sty", "zpx", 4, False),
+    0x95: ("sta", "zpx", 4, False),
+    0x96: ("stx", "zpy", 4, False),
+    0x98: ("tya", "imp", 2, False),
+    0x99: ("sta", "aby", 5, False),
+    0x9A: ("txs", "imp", 2, False),
+    0x9D: ("sta", "abx", 5, False),
+    0xA0: ("ldy", "im", 2, False),
+    0xA1: ("lda", "inx", 6, False),
+    0xA2: ("ldx", "im", 2, False),
+    0xA4: ("ldy", "zp", 3, False),
+    0xA5: ("lda", "zp", 3, False),
+    0xA6: ("ldx", "zp", 3, False),
+    0xA8: ("tay", "imp", 2, False),
+    0xA9: ("lda", "im", 2, False),
+    0xAA: ("tax", "imp", 2, False),
+    0xAC: ("ldy", "ab", 4, False),
+    0xAD: ("lda", "ab", 4, False),
+    0xAE: ("ldx", "ab", 4, False),
+    0xB0: ("bcs", "rel", 2, False),
+    0xB1: ("lda", "iny", 5, True),
+    0xB4: ("ldy", "zpx", 4, False),
+    0xB5: ("lda", "zpx", 4, False),
+    0xB6: ("ldx", "zpy", 4, False),
+    0xB8: ("clv", "imp", 2, False),
+    0xB9: ("lda", "aby", 4, True),
+    0xBA: ("tsx", "imp", 2, False),
+    0xBC: ("ldy", "abx", 4, True),
+    0xBD: ("lda", "abx", 4, True),
+    0xBE: ("ldx", "aby", 4, True),
+    0xC0: ("cpy", "im", 2, False),
+    0xC1: ("cmp", "inx", 6, False),
+    0xC4: ("cpy", "zp", 3, False),
+    0xC5: ("cmp", "zp", 3, False),
+    0xC6: ("dec", "zp", 5, False),
+    0xC8: ("iny", "imp", 2, False),
+    0xC9: ("cmp", "im", 2, False),
+    0xCA: ("dex", "imp", 2, False),
+    0xCC: ("cpy", "ab", 4, False),
+    0xCD: ("cmp", "ab", 4, False),
+    0xCE: ("dec", "ab", 6, False),
+    0xD0: ("bne", "rel", 2, False),
+    0xD1: ("cmp", "iny", 5, True),
+    0xD5: ("cmp", "zpx", 4, False),
+    0xD6: ("dec", "zpx", 6, False),
+    0xD8: ("cld", "imp", 2, False),
+    0xD9: ("cmp", "aby", 4, True),
+    0xDD: ("cmp", "abx", 4, True),
+    0xDE: ("dec", "abx", 7, False),
+    0xE0: ("cpx", "im", 2, False),
+    0xE1: ("sbc", "inx", 6, False),
+    0xE4: ("cpx", "zp", 3, False),
+    0xE5: ("sbc", "zp", 3, False),
+    0xE6: ("inc", "zp", 5, False),
+    0xE8: ("inx", "imp", 2, False),
+    0xE9: ("sbc", "im", 2, False),
+    0xEA: ("nop", "imp", 2, False),
+    0xEC: ("cpx", "ab", 4, False),
+    0xED: ("sbc", "ab", 4, False),
+    0xEE: ("inc", "ab", 6, False),
+    0xF0: ("beq", "rel", 2, False),
+    0xF1: ("sbc", "iny", 5, True),
+    0xF5: ("sbc", "zpx", 4, False),
+    0xF6: ("inc", "zpx", 6, False),
+    0xF8: ("sed", "imp", 2, False),
+    0xF9: ("sbc", "aby", 4, True),
+    0xFD: ("sbc", "abx", 4, True),
+    0xFE: ("inc", "abx", 7, False),
+}
+
+operand_sizes = {
+    "imp": 0, "acc": 0, "im": 1, "rel": 1, "zp": 1, "zpx": 1, "zpy": 1,
+    "ab": 2, "abx": 2, "aby": 2, "in": 2, "inx": 1, "iny": 1
+}
+
+# the bodies below name the registers and flags as plain variables, the recompiler
+# keeps them in locals and the optimized core turns them into attributes of the cpu,
+# operations that read memory find the operand in "value"
+
+# the n and z flags are kept together in nz, usually just the last result: z is set when
+# its low byte is 0 and n when bit 7 or 8 is, bit 8 lets n be set on its own
+read_operations = {
+    "adc": """
+if not d:
+    r = value + a + c
+    v = ~(a ^ value) & (a ^ r) & 0x80 != 0
+    c = r & 0x100 == 0x100
+    r &= 0xFF
+    a = r
+    nz = r
+else:
+    lo = (a & 0x0F) + (value & 0x0F) + c
+    hi = (a & 0xF0) + (value & 0xF0)
+    zero = not ((lo + hi) & 0xFF)
+    if lo > 0x09:
+        hi += 0x10
+        lo += 0x06
+    nz = (not zero) | (hi & 0x80) << 1
+    v = ~(a ^ value) & (a ^ hi) & 0x80 != 0
+    if hi > 0x90:
+        hi += 0x60
+    c = hi & 0x100 == 0x100
+    a = (lo & 0x0F) + (hi & 0xF0)
+""",
+    "sbc": """
+r = a - value - (not c)
+v = (a ^ value) & (a ^ r) & 0x80 != 0
+c = not (r & 0x100)
+r &= 0xFF
+nz = r
+if not d:
+    a = r
+else:
+    lo = (a & 0x0F) - (value & 0x0F) - (not c)
+    hi = (a & 0xF0) - (value & 0xF0)
+    if lo & 0x10:
+        lo -= 6
+        hi -= 1
+    if hi & 0x0100:
+        hi -= 0x60
+    a = (lo & 0x0F) | (hi & 0xF0)
+""",
+    "and": "a &= value\nnz = a",
+    "eor": "a ^= value\nnz = a",
+    "ora": "a |= value\nnz = a",
+    "lda": "a = value\nnz = a",
+    "ldx": "x = value\nnz = x",
+    "ldy": "y = value\nnz = y",
+    "cmp": "value = a - value\nc = value >= 0\nvalue &= 0xFF\nnz = value",
+    "cpx": "value = x - value\nc = value >= 0\nvalue &= 0xFF\nnz = value",
+    "cpy": "value = y - value\nc = value >= 0\nvalue &= 0xFF\nnz = value",
+    "bit": "nz = (a & value) | (value & 0x80) << 1\nv = (value & 0x40) == 0x40",
+}
+
+# read-modify-write operations change "value", which is then written back
+# (or copied back to the accumulator)
+modify_operations = {
+    "asl": "value <<= 1\nc = value >> 8\nvalue &= 0xFF\nnz = value",
+    "lsr": "c = value & 0x1\nvalue >>= 1\nnz = value",
+    "rol": "tmp = (value & 0x80) >> 7\nvalue = (value << 1 | c) & 0xFF\nc = tmp\nnz = value",
+    "ror": "tmp = value & 0x1\nvalue = (c << 7) | value >> 1\nc = tmp\nnz = value",
+    "inc": "value = (value + 1) & 0xFF\nnz = value",
+    "dec": "value = (value - 1) & 0xFF\nnz = value",
+}
+
+store_operations = {"sta": "a", "stx": "x", "sty": "y"}
+
+implied_operations = {
+    "clc": "c = 0",
+    "cld": "d = 0",
+    "cli": "i = 0",
+    "clv": "v = 0",
+    "sec": "c = 1",
+    "sed": "d = 1",
+    "sei": "i = 1",
+    "dex": "x = (x - 1) & 0xFF\nnz = x",
+    "dey": "y = (y - 1) & 0xFF\nnz = y",
+    "inx": "x = (x + 1) & 0xFF\nnz = x",
+    "iny": "y = (y + 1) & 0xFF\nnz = y",
+    "tax": "x = a\nnz = a",
+    "tay": "y = a\nnz = a",
+    "txa": "a = x\nnz = a",
+    "tya": "a = y\nnz = a",
+    "tsx": "x = s",
+    "txs": "s = x",
+    "nop": "",
+}
+
+branch_conditions = {
+    "bpl": "not nz & 0x180",
+    "bmi": "nz & 0x180",
+    "bvc": "not v",
+    "bvs": "v",
+    "bcc": "not c",
+    "bcs": "c",
+    "bne": "nz & 0xFF",
+    "beq": "not nz & 0xFF",
+}
+
+# php and plp
+status_to_int = "(c & 0x1) | (not nz & 0xFF) << 1 | (i & 0x1) << 2 | (d & 0x1) << 3 | (b & 0x1) << 4 | 0x20 | (v & 0x1) << 6 | (nz & 0x180 != 0) << 7"
+set_status = "c = value & 0x1\nnz = (not value & 0x2) | (value & 0x80) << 1\ni = (value >> 2) & 0x1\nd = (value >> 3) & 0x1\nb = (value >> 4) & 0x1\nv = (value >> 6) & 0x1"
+
+registers = ("a", "x", "y", "s", "c", "nz", "i", "d", "b", "v")
+register_use = re.compile(r"\b(" + "|".join(registers) + r")\b")
+register_assignment = re.compile(r"^\s*(" + "|".join(registers) + r")\s*(?:=(?!=)|[-+&|^]=|<<=|>>=)")
@@ -0,0 +1,557 @@
+import re
+from os.path import dirname, isfile
+
+from opcodes import (
+    instructions, operand_sizes, read_operations, modify_operations, store_operations,
+    implied_operations, branch_conditions, status_to_int, set_status, registers, register_use,
+    register_assignment
+)
+
+
+# names the generated code may use, and how a block gets them from the cpu
+prologue = (
+    ("memory", "memory = cpu.memory"),
+    ("timer", "timer = cpu.timer"),
+    ("ram", "ram = memory.ram"),
+    ("read", "read = memory.read"),
+    ("write", "write = memory.write"),
+    ("read2", "read2 = memory.read2"),
+    ("read_other", "read_other = memory.read_other"),
+    ("write_other", "write_other = memory.write_other"),
+    ("tia_read", "tia_read = memory.tia.read"),
+    ("tia_write", "tia_write = memory.tia.write_table"),
+)
+# a constant or ram read can take the place of "value" when an operation only uses it once
+simple_value = re.compile(r"^(0x[0-9a-f]+|ram\[0x[0-9a-f]+\])$")
+value_use = re.compile(r"\bvalue\b")
+value_assignment = re.compile(r"\bvalue\s*(?:=(?!=)|[-+&|^]=|<<=|>>=)")
+name_use = re.compile(r"\b(" + "|".join(name for name, _ in prologue) + r")\b")
+
+
+class Block:
+    # builds the source of one translated block
+    # cycles are summed while translating and only added to timer.time
+    # before something that can look at it (tia, riot, bank-switching) and on exit
+
+    def __init__(self, key, start, bank, hotspots, ram_ports, tia_registers):
+        self.key = key
+        self.start = start
+        self.bank = bank
+        self.mask = len(bank) - 1
+        self.hotspots = hotspots
+        self.ram_ports = ram_ports
+        self.tia_registers = tia_registers
+        self.banked = bool(hotspots)
+
+        self.lines = []
+        self.indent = 1
+        self.pending = 0  # cycles not yet added to timer.time
+        self.loop = False
+
+        # set by the last instruction when it may have switched banks or finished the frame
+        self.may_switch = False
+        self.may_finish = False
+
+        # where the block can continue, used to find code ahead of time
+        self.targets = set()
+        self.switch_targets = set()  # may be reached with another bank mapped in
+
+        self.name = f"block_{key}_{start:04x}"
+        self.source = None
+        self.preamble = []  # runs before the registers are loaded
+
+    def emit(self, code):
+        for line in code.strip("\n").split("\n"):
+            if line:
+                self.lines.append("    " * self.indent + line)
+
+    def emit_exit(self, pc, cycles=0):
+        # exits are filled in by render once the registers used by the block are known
+        self.lines.append(("exit", self.indent, self.pending + cycles, pc))
+        if isinstance(pc, int):
+            self.targets.add(pc)
+
+    def flush(self):
+        if self.pending:
+            self.emit(f"timer.time += {self.pending}")
+            self.pending = 0
+
+    def emit_lent(self, code):
+        # for the slow path of an access that is usually ram, the pending cycles
+        # are lent to the timer instead of flushing them on the fast path too
+        self.indent += 1
+        if self.pending:
+            self.emit(f"timer.time += {self.pending}")
+        self.emit(code)
+        if self.pending:
+            self.emit(f"timer.time -= {self.pending}")
+        self.indent -= 1
+
+    @staticmethod
+    def is_ram(address):
+        return address & 0x1280 == 0x80
+
+    def is_plain_rom(self, address):
+        offset = address & 0xFFF
+        return address & 0x1000 and offset not in self.hotspots and offset not in self.ram_ports
+
+    # memory access, these return the expression for the value read
+    def read_static(self, address):
+        if address & 0x1000:
+            offset = address & 0xFFF
+            if offset in self.hotspots:
+                self.may_switch = True
+                return f"read({address:#x})"
+            if offset in self.ram_ports:
+                return f"read({address:#x})"
+            return f"{self.bank[address & self.mask]:#x}"
+        if self.is_ram(address):
+            return f"ram[{address & 0x7F:#x}]"
+        self.flush()
+        if address & 0x200:
+            return f"read_other({address:#x})"
+        return f"tia_read({address:#x})"
+
+    def write_static(self, address, value):
+        if self.is_ram(address):
+            self.emit(f"ram[{address & 0x7F:#x}] = {value}")
+        elif address & 0x1000:
+            self.flush()
+            self.emit(f"write({address:#x}, {value})")
+            self.may_switch = True
+        elif address & 0x200:
+            self.flush()
+            self.emit(f"write_other({address:#x}, {value})")
+        elif address in self.tia_registers:
+            self.flush()
+            self.emit(f"tia_write[{address:#x}]({value})")
+            self.may_finish = address == 0  # vsync
+
+    def read_dynamic(self, address, base=None):
+        # base is the unindexed address of abx/aby, a table that is all plain rom
+        # is read straight from the bank
+        if base is not None and self.is_plain_rom(base) and (base & 0xFFF) + 0xFF <= 0xFFF:
+            if all(self.is_plain_rom(base + i) for i in range(0x100)):
+                return f"bank_{self.key}[({address}) & {self.mask:#x}]"
+        self.emit(f"ad = {address}")
+        self.emit("if ad & 0x1280 == 0x80:")
+        self.emit("    value = ram[ad & 0x7F]")
+        self.emit("else:")
+        self.emit_lent("value = read(ad)")
+        self.may_switch = True
+        return "value"
+
+    def write_dynamic(self, address, value):
+        if address != "ad":
+            self.emit(f"ad = {address}")
+        self.emit("if ad & 0x1280 == 0x80:")
+        self.emit(f"    ram[ad & 0x7F] = {value}")
+        self.emit("else:")
+        self.emit_lent(f"write(ad, {value})")
+        self.may_switch = True
+        self.may_finish = True
+
+    def address(self, mode, operand, penalty):
+        # returns (expression, static address, unindexed address), only one of the
+        # first two is set
+        if mode in ("zp", "ab"):
+            return None, operand, None
+        if mode == "zpx":
+            return f"({operand:#x} + x) & 0xFF", None, None
+        if mode == "zpy":
+            return f"({operand:#x} + y) & 0xFF", None, None
+        if mode in ("abx", "aby"):
+            index = mode[-1]
+            if penalty:
+                self.emit(f"if {index} > {0xFF - (operand & 0xFF):#x}:")
+                self.emit("    timer.time += 3")
+            if operand + 0xFF <= 0xFFFF:
+                return f"{operand:#x} + {index}", None, operand
+            return f"({operand:#x} + {index}) & 0xFFFF", None, None
+        if mode == "inx":
+            self.emit(f"ad = ({operand:#x} + x) & 0xFF")
+            self.emit("if 0x80 <= ad < 0xFF:")
+            self.emit("    ad = ram[ad & 0x7F] | ram[(ad + 1) & 0x7F] << 8")
+            self.emit("else:")
+            self.emit_lent("ad = read2(ad)")
+            return "ad", None, None
+        if mode == "iny":
+            if 0x80 <= operand < 0xFF:
+                self.emit(f"ad = ram[{operand & 0x7F:#x}] | ram[{(operand + 1) & 0x7F:#x}] << 8")
+            else:
+                self.flush()
+                self.emit(f"ad = read2({operand:#x})")
+            if penalty:
+                self.emit("if (ad & 0xF00) != ((ad + y) & 0xF00):")
+                self.emit("    timer.time += 3")
+            return "(ad + y) & 0xFFFF", None, None
+        raise ValueError(mode)
+
+    def read(self, mode, operand, penalty):
+        if mode == "im":
+            return f"{operand:#x}"
+        expression, static, base = self.address(mode, operand, penalty)
+        if static is not None:
+            return self.read_static(static)
+        return self.read_dynamic(expression, base)
+
+    def write(self, mode, operand, value):
+        expression, static, _ = self.address(mode, operand, False)
+        if static is not None:
+            self.write_static(static, value)
+        else:
+            self.write_dynamic(expression, value)
+
+    def modify(self, operation, mode, operand):
+        expression, static, _ = self.address(mode, operand, False)
+        if static is not None:
+            self.emit(f"value = {self.read_static(static)}")
+            self.emit(modify_operations[operation])
+            self.write_static(static, "value")
+        else:
+            self.read_dynamic(expression)  # leaves the address in ad
+            self.emit(modify_operations[operation])
+            self.write_dynamic("ad", "value")
+
+    def push(self, value):
+        self.write_dynamic("s", value)
+        self.emit("s = (s - 1) & 0xFF")
+
+    def pull(self):
+        self.emit("s = (s + 1) & 0xFF")
+        return self.read_dynamic("s")
+
+    def exit_checks(self, pc):
+        # leaves the block if the last instruction finished the frame or switched banks
+        conditions = []
+        if self.may_finish:
+            conditions.append("timer.frame_done")
+        if self.may_switch and self.banked:
+            conditions.append(f"memory.bank_key != {self.key}")
+        if conditions:
+            self.emit(f"if {' or '.join(conditions)}:")
+            self.indent += 1
+            self.emit_exit(pc)
+            self.indent -= 1
+            if self.may_switch and self.banked:
+                self.switch_targets.add(pc)
+        self.may_switch = self.may_finish = False
+
+    def render(self):
+        assigned = set()
+        used = set()
+        names = {"timer"}
+        for line in self.lines:
+            if isinstance(line, tuple):
+                continue
+            used.update(register_use.findall(line))
+            names.update(name_use.findall(line))
+            match = register_assignment.match(line)
+            if match:
+                assigned.add(match.group(1))
+        if len(names) > 1:
+            names.add("memory")
+
+        out = [f"def {self.name}(cpu):"]
+        out.extend("    " + line for line in self.preamble)
+        for prologue_name, code in prologue:
+            if prologue_name in names:
+                out.append("    " + code)
+        for register in registers:
+            if register in used:
+                out.append(f"    {register} = cpu.{register}")
+        extra = ""
+        if self.loop:
+            out.append("    while True:")
+            extra = "    "
+        for line in self.lines:
+            if isinstance(line, tuple):
+                _, indent, cycles, pc = line
+                pad = extra + "    " * indent
+                for register in registers:
+                    if register in assigned:
+                        out.append(f"{pad}cpu.{register} = {register}")
+                if cycles:
+                    out.append(f"{pad}timer.time += {cycles}")
+                out.append(f"{pad}cpu.pc = {pc}")
+                out.append(f"{pad}return")
+            else:
+                out.append(extra + line)
+        self.source = "\n".join(out) + "\n"
+        return self.source
+
+
+class Recompiler:
+    """
+    translates runs of instructions in cartridge rom into python functions
+
+    blocks are cached by bank and address, a block is left as soon as an
+    instruction may have switched banks so it only ever runs with the rom
+    it was translated from, anything that can't be translated is left to
+    the interpreter one instruction at a time
+
+    blocks found ahead of time by translate_rom are saved in cache/ and
+    loaded by every later run of the same rom
+    """
+
+    max_block_length = 64
+    cache_directory = dirname(__file__) + "/cache/"
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.blocks = {}
+        self.translated = {}  # blocks translated while running, kept for translate_rom
+        self.load_cache()
+
+    def clone(self, memory):
+        # blocks only depend on the rom, so a copy of the emulator can share them
+        from copy import copy
+
+        other = copy(self)
+        other.memory = memory
+        return other
+
+    def get_block(self, pc):
+        memory = self.memory
+        key = memory.bank_key << 16 | pc
+        block = self.blocks.get(key)
+        if block is None:
+            block = self.blocks[key] = self.translate(pc)
+        return block
+
+    def translate(self, pc):
+        from optimized_cpu import Core
+
+        block = self.generate(pc)
+        if block is None:
+            return Core.interpret
+        memory = self.memory
+        self.translated[memory.bank_key << 16 | pc] = block
+        # a snapshot of the mapping, e0 switches segments in place
+        namespace = {f"bank_{memory.bank_key}": memory.get_mapped_rom(memory.bank_key)}
+        exec(compile(block.source, f"<{block.name}>", "exec"), namespace)
+        return namespace[block.name]
+
+    def decode(self, pc):
+        opcode = self.memory.peek(pc)
+        if opcode not in instructions:
+            return None
+        operation, mode, cycles, penalty = instructions[opcode]
+        operand = 0
+        for i in range(operand_sizes[mode]):
+            byte = self.memory.peek(pc + 1 + i)
+            if byte is None:
+                return None
+            operand |= byte << (8 * i)
+        return operation, mode, cycles * 3, penalty, operand
+
+    def generate(self, start):
+        # returns the block starting at start, None if the first instruction
+        # has to be interpreted
+        from optimized_cpu import find_idle_loop
+
+        memory = self.memory
+        key = memory.bank_key
+        block = Block(key, start, memory.cur_bank, memory.hotspots, memory.ram_ports, set(memory.tia.write_table))
+        if find_idle_loop(memory, start):
+            block.preamble.append(f"cpu.idle_loop({start})")
+
+        pc = start
+        for count in range(1, self.max_block_length + 1):
+            decoded = self.decode(pc)
+            if decoded is None or decoded[0] in ("brk", "rti"):
+                if count == 1:
+                    return None
+                block.emit_exit(pc)
+                break
+            operation, mode, cycles, penalty, operand = decoded
+            next_pc = pc + 1 + operand_sizes[mode]
+            block.pending += cycles
+            block.emit(f"# {pc:04x} {operation} {mode}")
+
+            if operation in branch_conditions:
+                offset = operand - 0x100 if operand & 0x80 else operand
+                target = next_pc + offset
+                # same page test as the interpreter, made from the operand address
+                taken = 6 if ((pc + 1) & 0xF00) != ((pc + 1 + offset) & 0xF00) else 3
+                block.emit(f"if {branch_conditions[operation]}:")
+                block.indent += 1
+                if target == start:
+                    block.loop = True
+                    block.emit(f"timer.time += {block.pending + taken}")
+                    block.emit("continue")
+                else:
+                    block.emit_exit(target, taken)
+                block.indent -= 1
+
+            elif operation == "jmp":
+                if mode == "ab":
+                    if operand == start:
+                        block.loop = True
+                        block.emit(f"timer.time += {block.pending}")
+                        block.emit("continue")
+                    else:
+                        block.emit_exit(operand)
+                else:
+                    if Block.is_ram(operand) and Block.is_ram(operand + 1):
+                        block.emit(f"target = ram[{operand & 0x7F:#x}] | ram[{(operand + 1) & 0x7F:#x}] << 8")
+                    else:
+                        block.flush()
+                        block.emit(f"target = read2({operand:#x})")
+                    block.emit_exit("target")
+                break
+
+            elif operation == "jsr":
+                ret = pc + 2
+                block.push(f"{(ret >> 8) & 0xFF:#x}")
+                block.push(f"{ret & 0xFF:#x}")
+                block.emit_exit(operand)
+                block.targets.add(next_pc)  # where the rts comes back to
+                break
+
+            elif operation == "rts":
+                block.emit("if 0x7F <= s <= 0xFD:")
+                block.emit("    target = ram[(s + 1) & 0x7F] | ram[(s + 2) & 0x7F] << 8")
+                block.emit("else:")
+                block.emit_lent("target = read2(s + 1)")
+                block.emit("s = (s + 2) & 0xFF")
+                block.emit_exit("target + 1")
+                break
+
+            elif operation in read_operations:
+                value = block.read(mode, operand, penalty)
+                code = read_operations[operation]
+                if value == "value":
+                    block.emit(code)
+                elif simple_value.match(value) and not value_assignment.search(code) and len(value_use.findall(code)) == 1:
+                    block.emit(value_use.sub(value, code))
+                else:
+                    block.emit(f"value = {value}")
+                    block.emit(code)
+            elif operation in store_operations:
+                block.write(mode, operand, store_operations[operation])
+            elif operation in modify_operations:
+                if mode == "acc":
+                    block.emit("value = a")
+                    block.emit(modify_operations[operation])
+                    block.emit("a = value")
+                else:
+                    block.modify(operation, mode, operand)
+            elif operation in implied_operations:
+                block.emit(implied_operations[operation])
+            elif operation == "pha":
+                block.push("a")
+            elif operation == "php":
+                block.push(f"({status_to_int})")
+            elif operation == "pla":
+                block.emit(f"a = {block.pull()}")
+            elif operation == "plp":
+                block.pull()
+                block.emit(set_status)
+
+            block.exit_checks(next_pc)
+            pc = next_pc
+            if count == self.max_block_length or pc > 0xFFFF:
+                block.emit_exit(pc)
+                break
+
+        block.render()
+        return block
+
+    # ahead of time translation
+    def cache_path(self):
+        # one file per rom, mapping and emulator version
+        from hashlib import sha1
+
+        memory = self.memory
+        rom = memory.rom_sha1[:16]
+        version = sha1()
+        for module in ("recompiler.py", "memory.py", "opcodes.py", "optimized_cpu.py"):
+            with open(dirname(__file__) + "/" + module, "rb") as f:
+                version.update(f.read())
+        super_chip = "_sc" if memory.super_chip else ""
+        return f"{self.cache_directory}{rom}_{memory.method}{super_chip}_{version.hexdigest()[:8]}.py"
+
+    def load_cache(self):
+        from importlib.util import spec_from_file_location, module_from_spec
+
+        path = self.cache_path()
+        if not isfile(path):
+            return
+        spec = spec_from_file_location("translated_rom", path)
+        module = module_from_spec(spec)
+        spec.loader.exec_module(module)
+        for key in module.bank_keys:
+            setattr(module, f"bank_{key}", self.memory.get_mapped_rom(key))
+        self.blocks.update(module.blocks)
+
+    def walk(self):
+        # finds the blocks reachable from the reset and break vectors of every bank,
+        # following branches, jumps and subroutine calls
+        memory = self.memory
+        if memory.banks and not hasattr(memory, "segments"):
+            keys = range(len(memory.banks))
+        else:
+            keys = [memory.bank_key]
+        start_key = memory.bank_key
+
+        found = {}
+        queue = [(key, pc) for key in keys for pc in (memory.rom_reset_vector, memory.rom_break_vector)]
+        while queue:
+            key, pc = queue.pop()
+            if (key, pc) in found:
+                continue
+            if key != memory.bank_key:
+                memory.switch_bank(key)
+            block = found[key, pc] = self.generate(pc)
+            if block is None:
+                continue
+            queue.extend((key, target) for target in block.targets)
+            queue.extend((other, target) for target in block.switch_targets for other in keys)
+        if memory.bank_key != start_key:
+            memory.switch_bank(start_key)
+        return {key << 16 | pc: block for (key, pc), block in found.items() if block is not None}
+
+    def translate_rom(self):
+        # writes every block walk finds, and any translated while running, to the
+        # cache, returns the file's path
+        from os import makedirs
+
+        blocks = self.walk()
+        blocks.update(self.translated)
+        path = self.cache_path()
+        makedirs(self.cache_directory, exist_ok=True)
+        with open(path, "w") as f:
+            f.write("# blocks translated ahead of time by recompiler.py, delete to translate again\n\n\n")
+            for block in blocks.values():
+                f.write(block.source + "\n\n")
+            f.write(f"bank_keys = {sorted({block.key for block in blocks.values()})}\n\n")
+            f.write("blocks = {\n")
+            for key, block in sorted(blocks.items()):
+                f.write(f"    {key:#x}: {block.name},\n")
+            f.write("}\n")
+        self.load_cache()
+        return path
+
+
+def main():
+    import argparse
+    from atari import Atari2600
+
+    parser = argparse.ArgumentParser(description="translate a rom ahead of time, later runs with --recompile load it")
+    parser.add_argument("rom")
+    parser.add_argument("-b", "--bank-switching", default="", choices=["2k", "4k", "f8", "e0", "fa", "f6", "f4", "ef"])
+    parser.add_argument("-s", "--super-chip", action="store_true")
+    parser.add_argument("--frames", type=int, default=0,
+                        help="run this many frames first, to also find code only reached through jump tables or rts")
+    args = parser.parse_args()
+
+    atari = Atari2600(args.rom, args.bank_switching, args.super_chip, audio=False, display=False, recompile=True)
+    atari.run_frames(args.frames)
+    recompiler = atari.cpu.recompiler
+    path = recompiler.translate_rom()
+    print(f"{len(recompiler.blocks)} blocks written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# keeps the last few seconds of save states so play can be wound back, every state but the
+# keyframes is stored as the runs of bytes that differ from the keyframe before it
+import re
+import struct
+from collections import deque
+
+# a run of changed bytes, short stretches of unchanged ones are taken along rather than
+# starting a new run
+changed_run = re.compile(rb"[^\x00](?:\x00{0,4}[^\x00])*")
+run_header = struct.Struct("<HH")
+
+
+def xor(a, b):
+    return (int.from_bytes(a, "little") ^ int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+def encode_delta(state, keyframe):
+    delta = xor(state, keyframe)
+    return b"".join(run_header.pack(run.start(), run.end() - run.start()) + run.group()
+                    for run in changed_run.finditer(delta))
+
+
+def decode_delta(delta, keyframe):
+    changes = bytearray(len(keyframe))
+    offset = 0
+    while offset < len(delta):
+        start, size = run_header.unpack_from(delta, offset)
+        offset += run_header.size
+        changes[start:start + size] = delta[offset:offset + size]
+        offset += size
+    return xor(changes, keyframe)
+
+
+class Rewind:
+    def __init__(self, frames=3600, keyframe_interval=60):
+        # frames is how far back it can go (3600 is a minute), memory use is about
+        # frames / keyframe_interval save states plus the deltas, a few MB for a minute
+        self.keyframe_interval = keyframe_interval
+        self.states = deque(maxlen=frames)  # (keyframe, None) or (keyframe it's a delta of, delta)
+        self.keyframe = None
+        self.captured = 0
+
+    def __len__(self):
+        return len(self.states)
+
+    @property
+    def nbytes(self):
+        keyframes = {id(keyframe): len(keyframe) for keyframe, _ in self.states}
+        return sum(keyframes.values()) + sum(len(delta) for _, delta in self.states if delta is not None)
+
+    def capture(self, atari):
+        # call once a frame, between frames
+        state = atari.save_state()
+        if self.captured % self.keyframe_interval == 0 or len(state) != len(self.keyframe):
+            self.keyframe = state
+            self.states.append((state, None))
+        else:
+            self.states.append((self.keyframe, encode_delta(state, self.keyframe)))
+        self.captured += 1
+
+    def rewind(self, atari, frames=1):
+        # goes back to the state captured frames captures ago (as far as the buffer reaches),
+        # dropping the later ones, returns how many frames it went back
+        frames = min(frames, len(self.states))
+        if frames == 0:
+            return 0
+        for _ in range(frames - 1):
+            self.states.pop()
+        keyframe, delta = self.states.pop()
+        atari.load_state(keyframe if delta is None else decode_delta(delta, keyframe))
+        # the next capture starts over with a keyframe
+        self.captured = 0
+        return frames
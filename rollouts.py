@@ -0,0 +1,83 @@
+# plays many input sequences from one emulator state in parallel, each worker is a fork
+# of this process so the rom, instruction tables and translated code are already loaded
+# (needs os.fork, so not on windows)
+import os
+import pickle
+from hashlib import sha1
+
+
+def play(atari, inputs, score=None):
+    # plays inputs from atari's current state, one dict of controller registers per frame
+    # (e.g. {"input_a": 0xEF, "input4": 0x00} for up and fire on a joystick),
+    # returns (ram, score, digest of the last frame), only the last frame is rendered
+    controller = atari.controller
+    inputs = list(inputs)
+    atari.tia.set_rendering(False)
+    for index, frame in enumerate(inputs):
+        if index == len(inputs) - 1:
+            atari.tia.set_rendering(True)
+        for name, value in frame.items():
+            setattr(controller, name, value)
+        atari.run_frames(1)
+    atari.tia.set_rendering(True)
+    return bytes(atari.memory.ram), score(atari) if score else None, sha1(atari.tia.frame.tobytes()).hexdigest()
+
+
+def run_rollouts(atari, sequences, score=None, workers=None):
+    # plays every sequence of inputs from atari's current state, returns play's result for
+    # each in order, atari itself is left as it was
+    sequences = list(sequences)
+    workers = min(workers or os.cpu_count() or 1, len(sequences))
+    running = []
+    for worker in range(workers):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            status = 1
+            try:
+                results = rollout_worker(atari, sequences[worker::workers], score)
+                data = pickle.dumps(("ok", results))
+                status = 0
+            except BaseException:
+                import traceback
+
+                data = pickle.dumps(("error", traceback.format_exc()))
+            finally:
+                try:
+                    with os.fdopen(write_end, "wb") as f:
+                        f.write(data)
+                finally:
+                    os._exit(status)
+        os.close(write_end)
+        running.append((pid, read_end))
+
+    results = [None] * len(sequences)
+    errors = []
+    for worker, (pid, read_end) in enumerate(running):
+        with os.fdopen(read_end, "rb") as f:
+            data = f.read()
+        os.waitpid(pid, 0)
+        if not data:
+            errors.append(f"worker {worker} exited without a result")
+            continue
+        status, value = pickle.loads(data)
+        if status == "ok":
+            results[worker::workers] = value
+        else:
+            errors.append(value)
+    if errors:
+        raise RuntimeError("rollout failed:\n" + "\n".join(errors))
+    return results
+
+
+def rollout_worker(atari, sequences, score):
+    # runs in the forked child, nothing here may draw to the parent's window
+    atari.tia.screen = None
+    atari.tia.play_audio = False
+    start = atari.save_state(frame_buffer=True)
+    results = []
+    for inputs in sequences:
+        atari.load_state(start)
+        results.append(play(atari, inputs, score))
+    return results
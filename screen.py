@@ -0,0 +1,32 @@
+import pygame
+
+
+class Screen:
+    # aspect ratio (5:3)
+    width_ratio = 5
+    height_ratio = 3
+
+    def __init__(self, line_width, width, height):
+        self.line_width = line_width
+        self.height = height
+
+        # final picture dimensions
+        self.picture_dims = (width * self.width_ratio, height * self.height_ratio)
+        self.scaling_dims = (line_width * self.width_ratio, height * self.height_ratio)
+        self.cropping_dims = ((line_width - width) * self.width_ratio, 0, width * self.width_ratio, height * self.height_ratio)
+
+        pygame.init()
+        pygame.event.set_allowed([pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP])
+        self.screen = pygame.display.set_mode(self.picture_dims)
+        pygame.display.set_caption("Atari 2600")
+        self.background = pygame.Surface((line_width, height))
+        self.background = self.background.convert()
+
+    @staticmethod
+    def get_events():
+        return pygame.event.get()
+
+    def show(self, canvas):
+        pygame.surfarray.blit_array(self.background, canvas.reshape((self.line_width, self.height), order="F"))
+        self.screen.blit(pygame.transform.scale(self.background, self.scaling_dims), (0, 0), self.cropping_dims)
+        pygame.display.flip()
@@ -0,0 +1,41 @@
+from atari import Atari2600
+
+# a 4k rom that starts a frame with vsync and vblank and then draws 256 lines of different colours
+frame_loop = bytes((
+    0xA9, 0x02,  # start: lda #2
+    0x85, 0x00,  # sta VSYNC
+    0x85, 0x01,  # sta VBLANK
+    0x85, 0x02,  # sta WSYNC
+    0x85, 0x02,  # sta WSYNC
+    0x85, 0x02,  # sta WSYNC
+    0xA9, 0x00,  # lda #0
+    0x85, 0x00,  # sta VSYNC
+    0x85, 0x01,  # sta VBLANK
+    0xA2, 0x00,  # ldx #0
+    0x86, 0x09,  # line: stx COLUBK
+    0x85, 0x02,  # sta WSYNC
+    0xCA,  # dex
+    0xD0, 0xF9,  # bne line
+    0x4C, 0x00, 0xF0,  # jmp start
+))
+
+
+def make_atari(tmp_path):
+    rom = tmp_path / "frame_loop.bin"
+    rom.write_bytes(frame_loop.ljust(0xFFC, b"\xEA") + b"\x00\xF0\x00\xF0")
+    return Atari2600(str(rom), audio=False, display=False)
+
+
+def test_reset_start_frame_does_not_depend_on_rendering(tmp_path):
+    atari = make_atari(tmp_path)
+    atari.tia.set_rendering(False)
+    atari.reset(3)
+    atari.tia.set_rendering(True)
+    atari.run_frames(2)
+    atari.reset(3)
+
+    fresh = make_atari(tmp_path)
+    fresh.reset(3)
+    assert fresh.tia.frame.any()
+    assert (atari.tia.frame == fresh.tia.frame).all()
+    assert atari.save_state() == fresh.save_state()
@@ -0,0 +1,96 @@
+# runs several emulators in their own processes, each one writes its last frame and ram
+# straight into shared memory so stepping them never pickles a picture, frames are the visible
+# height x width (220 x 160) colours without the horizontal blank
+from multiprocessing import Pipe, Process, shared_memory
+
+import numpy as np
+
+from graphics import Tia
+
+
+class VecAtari:
+    frame_shape = (Tia.height, Tia.width)
+
+    def __init__(self, rom, num_envs, done=None, auto_reset=True, **options):
+        # options are passed on to Atari2600, done(atari) says when an episode is over
+        # (a module level function if the processes aren't forked), with auto_reset the
+        # step after that one resets the emulator instead of playing its inputs
+        self.num_envs = num_envs
+        self.frame_memory = shared_memory.SharedMemory(create=True, size=num_envs * Tia.height * Tia.width * 4)
+        self.ram_memory = shared_memory.SharedMemory(create=True, size=num_envs * 128)
+        # both are overwritten in place by every step and reset
+        self.frames = np.ndarray((num_envs,) + self.frame_shape, "int32", self.frame_memory.buf)
+        self.ram = np.ndarray((num_envs, 128), "uint8", self.ram_memory.buf)
+
+        self.pipes = []
+        self.processes = []
+        for index in range(num_envs):
+            pipe, worker_pipe = Pipe()
+            process = Process(target=worker, daemon=True, args=(
+                worker_pipe, index, num_envs, self.frame_memory.name, self.ram_memory.name, rom, options, done,
+                auto_reset
+            ))
+            process.start()
+            worker_pipe.close()
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+    def reset(self):
+        # puts every emulator back in its starting state, returns the shared frames and ram
+        for pipe in self.pipes:
+            pipe.send(("reset", None))
+        for pipe in self.pipes:
+            pipe.recv()
+        return self.frames, self.ram
+
+    def step(self, inputs):
+        # inputs has one dict of controller registers per emulator (see rollouts.play),
+        # runs them all one frame, returns the shared frames and ram and the done flags
+        for pipe, registers in zip(self.pipes, inputs):
+            pipe.send(("step", registers))
+        dones = np.array([pipe.recv() for pipe in self.pipes])
+        return self.frames, self.ram, dones
+
+    def close(self):
+        for pipe in self.pipes:
+            pipe.send(("close", None))
+        for process in self.processes:
+            process.join()
+        del self.frames, self.ram
+        self.frame_memory.close()
+        self.frame_memory.unlink()
+        self.ram_memory.close()
+        self.ram_memory.unlink()
+
+
+def worker(pipe, index, num_envs, frame_name, ram_name, rom, options, done, auto_reset):
+    from atari import Atari2600
+
+    atari = Atari2600(rom, **dict(options, audio=False, display=False))
+    frame_memory = shared_memory.SharedMemory(frame_name)
+    ram_memory = shared_memory.SharedMemory(ram_name)
+    frame = np.ndarray((num_envs,) + VecAtari.frame_shape, "int32", frame_memory.buf)[index]
+    visible = Tia.line_width - Tia.width
+    ram = np.ndarray((num_envs, 128), "uint8", ram_memory.buf)[index]
+
+    controller = atari.controller
+    finished = False
+    while True:
+        command, data = pipe.recv()
+        if command == "close":
+            break
+        if command == "reset" or finished and auto_reset:
+            atari.reset()
+            finished = False
+        elif command == "step":
+            for name, value in data.items():
+                setattr(controller, name, value)
+            atari.run_frames(1)
+            finished = bool(done and done(atari))
+        frame[:] = atari.tia.frame.reshape(Tia.height, Tia.line_width)[:, visible:]
+        ram[:] = atari.memory.ram
+        pipe.send(finished)
+
+    del frame, ram
+    frame_memory.close()
+    ram_memory.close()